@@ -3,11 +3,17 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime
+import click
 import os
 import json
 
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, load_only
+
 from config import Config
 from extensions import db, login_manager, babel
+from schema import upgrade_schema
+from modules.jobs import JOB_CARD_COLUMNS
 from models import User, Skill, Experience, Education, Resume, Job, Application, Post, Comment, Like, Connection, Endorsement
 
 app = Flask(__name__)
@@ -17,6 +23,18 @@ app.config.from_object(Config)
 db.init_app(app)
 login_manager.init_app(app)
 
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') and app.config['SQLITE_WAL']:
+    from sqlalchemy import event
+    
+    with app.app_context():
+        @event.listens_for(db.engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+            cursor.close()
+
 def get_locale():
     # If a user is logged in, use their preferred language
     if current_user.is_authenticated and current_user.preferred_language:
@@ -51,6 +69,12 @@ def nl2br(value):
 
 app.jinja_env.filters['nl2br'] = nl2br
 
+def likes(post):
+    from modules.like_counter import like_count
+    return like_count(post)
+
+app.jinja_env.filters['likes'] = likes
+
 @app.context_processor
 def inject_locale():
     return dict(get_locale=get_locale)
@@ -63,7 +87,8 @@ def load_user(id):
 
 @app.route('/')
 def index():
-    featured_jobs = Job.query.filter_by(is_active=True).order_by(Job.created_at.desc()).limit(6).all()
+    featured_jobs = Job.query.filter_by(is_active=True).options(load_only(*JOB_CARD_COLUMNS))\
+                             .order_by(Job.created_at.desc()).limit(6).all()
     return render_template('index.html', featured_jobs=featured_jobs)
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -160,12 +185,42 @@ def set_language(lang):
 @login_required
 def dashboard():
     if current_user.role == 'employer':
-        jobs = Job.query.filter_by(employer_id=current_user.id).all()
-        applications = Application.query.join(Job).filter(Job.employer_id == current_user.id).all()
-        return render_template('dashboard/employer.html', jobs=jobs, applications=applications)
+        jobs = Job.query.filter_by(employer_id=current_user.id)\
+                        .options(load_only(*JOB_CARD_COLUMNS, Job.is_active)).all()
+        
+        # Aggregate in SQL instead of loading every application
+        employer_apps = Application.query.join(Job).filter(Job.employer_id == current_user.id)
+        application_counts = dict(
+            employer_apps.with_entities(Application.job_id, func.count(Application.id))
+                         .group_by(Application.job_id).all()
+        )
+        status_counts = dict(
+            employer_apps.with_entities(Application.status, func.count(Application.id))
+                         .group_by(Application.status).all()
+        )
+        
+        applicant_options = (
+            joinedload(Application.applicant).load_only(User.id, User.name, User.headline, User.profile_image),
+            joinedload(Application.job).load_only(Job.id, Job.title)
+        )
+        recent_applications = employer_apps.options(*applicant_options)\
+                                           .order_by(Application.id.desc()).limit(10).all()
+        top_candidates = employer_apps.options(*applicant_options)\
+                                      .filter(Application.ai_score.isnot(None))\
+                                      .order_by(Application.ai_score.desc(), Application.id.desc())\
+                                      .limit(5).all()
+        
+        return render_template('dashboard/employer.html',
+                               jobs=jobs,
+                               application_counts=application_counts,
+                               status_counts=status_counts,
+                               total_applications=sum(status_counts.values()),
+                               recent_applications=recent_applications,
+                               top_candidates=top_candidates)
     else:
-        applications = Application.query.filter_by(user_id=current_user.id).all()
-        recommended_jobs = Job.query.filter_by(is_active=True).limit(5).all()
+        applications = Application.query.filter_by(user_id=current_user.id)\
+            .options(joinedload(Application.job).load_only(Job.id, Job.title, Job.company, Job.location)).all()
+        recommended_jobs = Job.query.filter_by(is_active=True).options(load_only(*JOB_CARD_COLUMNS)).limit(5).all()
         return render_template('dashboard/seeker.html', applications=applications, recommended_jobs=recommended_jobs)
 
 @app.route('/profile')
@@ -196,10 +251,9 @@ def edit_profile():
         if 'profile_image' in request.files:
             file = request.files['profile_image']
             if file and file.filename:
+                from modules.storage import save_upload
                 filename = secure_filename(f"{current_user.id}_{file.filename}")
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'profiles', filename)
-                file.save(file_path)
-                current_user.profile_image = f"/static/uploads/profiles/{filename}"
+                current_user.profile_image = save_upload(file, 'profiles', filename)
         
         db.session.commit()
         return redirect(url_for('profile'))
@@ -211,10 +265,17 @@ def edit_profile():
 def update_skills():
     data = request.get_json()
     
-    # Clear existing skills and add new ones
-    Skill.query.filter_by(user_id=current_user.id).delete()
+    # Keep skills that are still listed, so only new ones get new rows
+    # (trending skills counts new rows), remove the rest and add the new ones
+    existing = {skill.name.strip().lower(): skill for skill in
+                Skill.query.filter_by(user_id=current_user.id).all()}
     
     for skill_data in data.get('skills', []):
+        key = (skill_data.get('name') or '').strip().lower()
+        skill = existing.pop(key, None)
+        if skill is not None:
+            skill.category = skill_data.get('category', 'technical')
+            continue
         skill = Skill(
             user_id=current_user.id,
             name=skill_data.get('name'),
@@ -222,6 +283,9 @@ def update_skills():
         )
         db.session.add(skill)
     
+    for skill in existing.values():
+        db.session.delete(skill)
+    
     db.session.commit()
     return jsonify({'success': True})
 
@@ -281,9 +345,39 @@ app.register_blueprint(social_bp)
 app.register_blueprint(tests_bp)
 app.register_blueprint(events_bp)
 
+# Load letter fonts and styles once per worker process instead of on the first request
+from modules.letter_generator import warm_up as warm_up_letters
+warm_up_letters()
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create missing tables, columns and indexes"""
+    try:
+        upgrade_schema()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    print("Database schema is up to date.")
+
+@app.cli.command('migrate-uploads')
+def migrate_uploads_command():
+    """Move uploads into sharded directories and record them in the storage manifest"""
+    from modules.storage import migrate_existing
+    summary = migrate_existing()
+    print(f"Moved {summary['moved']} files, registered {summary['registered']} in the manifest.")
+
+@app.cli.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help='Report unreferenced files without deleting them')
+def gc_uploads_command(dry_run):
+    """Delete stored files that are no longer referenced"""
+    from modules.storage import collect_garbage
+    summary = collect_garbage(dry_run=dry_run)
+    action = 'Would remove' if dry_run else 'Removed'
+    print(f"{action} {summary['removed']} of {summary['scanned']} files, "
+          f"{summary['bytes_freed'] / (1024 * 1024):.1f} MiB.")
+
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
     app.run(debug=True, port=5000)
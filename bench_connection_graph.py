@@ -0,0 +1,62 @@
+"""
+Benchmark the people-you-may-know graph on a synthetic connection graph.
+Runs in memory without a database: python bench_connection_graph.py [num_edges] [num_users]
+"""
+import sys
+import time
+import numpy as np
+
+from modules.connection_graph import ConnectionGraph
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def main():
+    num_edges = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    num_users = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    rng = np.random.default_rng(42)
+    
+    # Skewed degrees: a few well-connected users, a long tail of small networks
+    src = rng.zipf(1.6, num_edges) % num_users
+    dst = rng.integers(0, num_users, num_edges)
+    
+    started = time.perf_counter()
+    graph = ConnectionGraph.from_edges(src, dst, size=num_users)
+    built = time.perf_counter() - started
+    degrees = np.diff(graph.indptr)
+    print(f"{num_edges} edges, {num_users} users: built in {built * 1000:.0f} ms, "
+          f"{graph.nbytes / 1024 / 1024:.1f} MiB, median degree {int(np.median(degrees))}, max {degrees.max()}")
+    
+    skill_names = [f'skill{i}' for i in range(200)]
+    skills = {}
+    
+    def load_skills(user_id):
+        # Random skill sets for the user and their candidates, as suggest() would load them
+        for candidate in [user_id] + graph.candidate_pool(user_id)[0].tolist():
+            if candidate not in skills:
+                skills[candidate] = set(rng.choice(skill_names, 8).tolist())
+    
+    users = rng.integers(0, num_users, 1000).tolist()
+    for label in ('suggestions', 'suggestions after 10000 changes'):
+        latencies = []
+        for user_id in users:
+            load_skills(user_id)
+            started = time.perf_counter()
+            graph.rank(user_id, 5, skills=skills)
+            latencies.append(time.perf_counter() - started)
+        print(f"{label:<34} p50 {percentile(latencies, 50) * 1000:6.2f} ms  p99 {percentile(latencies, 99) * 1000:6.2f} ms")
+        
+        if label == 'suggestions':
+            started = time.perf_counter()
+            pairs = rng.integers(0, num_users, (10000, 2)).tolist()
+            for i, (a, b) in enumerate(pairs):
+                if i % 2:
+                    graph.remove_edge(a, b)
+                else:
+                    graph.add_edge(a, b)
+            elapsed = time.perf_counter() - started
+            print(f"{'10000 accepts/rejects':<34} {elapsed / len(pairs) * 1e6:6.1f} us each (includes one compaction)")
+
+if __name__ == '__main__':
+    main()
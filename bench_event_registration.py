@@ -0,0 +1,106 @@
+"""
+Load test concurrent event registration against a capacity-limited event.
+Uses a throwaway SQLite database in WAL mode:
+python bench_event_registration.py [concurrent_users] [capacity] [rounds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+
+from app import app, db
+from models import User, Event, EventRegistration
+from sqlalchemy import func, text
+from datetime import datetime, timedelta
+
+def seed(num_users):
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [{
+        'email': f'user{i}@example.com',
+        'password_hash': 'x',
+        'name': f'User {i}',
+        'role': 'seeker',
+        'created_at': datetime.utcnow()
+    } for i in range(num_users)])
+    db.session.commit()
+    return [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+
+def create_event(capacity):
+    event = Event(title='Internship Fair', event_type='internship_fair', is_internship=True,
+                  start_date=datetime.utcnow() + timedelta(days=7), capacity=capacity, waitlist_enabled=True)
+    db.session.add(event)
+    db.session.commit()
+    return event.id
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run_round(event_id, user_ids):
+    """Register every user at once, each from its own thread and client"""
+    barrier = threading.Barrier(len(user_ids))
+    latencies = []
+    outcomes = {'registered': 0, 'waitlisted': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def register(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        barrier.wait()
+        started = time.perf_counter()
+        response = client.post(f'/events/{event_id}/register')
+        elapsed = time.perf_counter() - started
+        data = response.get_json(silent=True) or {}
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code != 200 or not data.get('success'):
+                outcomes['failed'] += 1
+            elif data.get('waitlisted'):
+                outcomes['waitlisted'] += 1
+            else:
+                outcomes['registered'] += 1
+
+    threads = [threading.Thread(target=register, args=(user_id,)) for user_id in user_ids]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, outcomes
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    capacity = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    with app.app_context():
+        user_ids = seed(num_users)
+        journal_mode = db.session.execute(text('PRAGMA journal_mode')).scalar()
+        print(f"{num_users} concurrent registrations, capacity {capacity}, journal_mode={journal_mode}")
+
+        for round_number in range(1, rounds + 1):
+            event_id = create_event(capacity)
+            elapsed, latencies, outcomes = run_round(event_id, user_ids)
+
+            db.session.expire_all()
+            counts = dict(db.session.query(EventRegistration.status, func.count())
+                          .filter_by(event_id=event_id)
+                          .group_by(EventRegistration.status))
+            registered_count = db.session.get(Event, event_id).registered_count
+            overbooked = counts.get('registered', 0) > capacity or registered_count != counts.get('registered', 0)
+
+            print(f"round {round_number}: {elapsed:6.2f}s  "
+                  f"p50 {percentile(latencies, 50) * 1000:7.1f}ms  "
+                  f"p99 {percentile(latencies, 99) * 1000:7.1f}ms  "
+                  f"registered {counts.get('registered', 0)} (counter {registered_count})  "
+                  f"waitlisted {counts.get('waitlisted', 0)}  failed {outcomes['failed']}  "
+                  f"{'OVERBOOKED' if overbooked else 'ok'}")
+
+if __name__ == '__main__':
+    main()
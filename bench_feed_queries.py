@@ -0,0 +1,93 @@
+"""
+Count the SQL statements issued by one feed render and check they stay bounded
+however many posts, comments and likes the page shows.
+Uses a throwaway SQLite database: python bench_feed_queries.py [num_friends] [posts_per_friend]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+
+from app import app, db
+from models import User, Post, Comment, Like, Connection
+from modules.timeline import rebuild
+from sqlalchemy import event
+from datetime import datetime
+
+# Statements allowed per render: session user, timeline, large connections,
+# posts with authors, comment counts, first comments with authors, likes, the
+# three suggestion queries and a little slack for the layout. The connection
+# graph and trending skills load on their own threads and aren't counted.
+MAX_STATEMENTS = 12
+
+def seed(num_friends, posts_per_friend):
+    db.create_all()
+    now = datetime.utcnow()
+    db.session.execute(User.__table__.insert(), [{
+        'email': f'user{i}@example.com',
+        'password_hash': 'x',
+        'name': f'User {i}',
+        'role': 'seeker',
+        'created_at': now
+    } for i in range(num_friends + 1)])
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    reader, friends = user_ids[0], user_ids[1:]
+    
+    db.session.execute(Connection.__table__.insert(), [
+        {'user_id': reader, 'connected_user_id': friend, 'status': 'accepted', 'created_at': now}
+        for friend in friends
+    ])
+    db.session.execute(Post.__table__.insert(), [
+        {'user_id': friend, 'content': f'Update {n} from {friend}', 'post_type': 'text', 'likes_count': 0, 'created_at': now}
+        for n in range(posts_per_friend) for friend in friends
+    ])
+    post_ids = [post_id for (post_id,) in db.session.query(Post.id)]
+    db.session.execute(Comment.__table__.insert(), [
+        {'post_id': post_id, 'user_id': friends[(post_id + n) % len(friends)], 'content': f'Comment {n}', 'created_at': now}
+        for post_id in post_ids for n in range(5)
+    ])
+    db.session.execute(Like.__table__.insert(), [
+        {'post_id': post_id, 'user_id': user_id, 'created_at': now}
+        for post_id in post_ids[::2] for user_id in (reader, friends[post_id % len(friends)])
+    ])
+    db.session.commit()
+    rebuild()
+    return reader
+
+def main():
+    num_friends = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    posts_per_friend = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    
+    with app.app_context():
+        reader = seed(num_friends, posts_per_friend)
+        engine = db.engine
+    
+    statements = []
+    request_thread = threading.get_ident()
+    event.listen(engine, 'before_cursor_execute',
+                 lambda *args: threading.get_ident() == request_thread and statements.append(args[2]))
+    
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(reader)
+        session['_fresh'] = True
+    
+    for page, url in enumerate(('/social/feed', '/social/feed?before=100')):
+        statements.clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.status_code
+        print(f"{url:<28} {len(statements):3d} statements {elapsed * 1000:8.1f} ms")
+        if len(statements) > MAX_STATEMENTS:
+            for statement in statements:
+                print('   ', ' '.join(statement.split())[:120])
+            sys.exit(f"Feed render issued {len(statements)} statements, expected at most {MAX_STATEMENTS}")
+    print('ok')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark full-row vs projection-only job queries on a synthetic dataset.
+Uses a throwaway SQLite database: python bench_job_queries.py [num_jobs]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+
+from app import app, db
+from models import User, Job, make_snippet
+from modules.jobs import JOB_CARD_COLUMNS
+from sqlalchemy.orm import load_only
+from datetime import datetime
+import json
+
+def seed(num_jobs):
+    employer = User(email='bench@example.com', password_hash='x', name='Bench', role='employer')
+    db.session.add(employer)
+    db.session.commit()
+    
+    description = 'We are hiring engineers to build reliable systems at scale. ' * 40
+    requirements = json.dumps(['Strong fundamentals', 'Team player', 'Ownership'] * 10)
+    batch = []
+    for i in range(num_jobs):
+        batch.append({
+            'employer_id': employer.id,
+            'title': f'Software Engineer {i}',
+            'company': 'BenchCorp',
+            'description': description,
+            'description_snippet': make_snippet(description),
+            'requirements': requirements,
+            'skills_required': json.dumps(['Python', 'SQL', 'AWS']),
+            'experience_min': i % 8,
+            'location': 'Bangalore',
+            'job_type': 'full-time',
+            'is_active': True,
+            'created_at': datetime.utcnow()
+        })
+        if len(batch) == 5000:
+            db.session.execute(Job.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Job.__table__.insert(), batch)
+    db.session.commit()
+
+def measure(label, build_query, runs=3):
+    best_time = best_peak = None
+    for _ in range(runs):
+        db.session.expunge_all()
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = build_query().all()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del rows
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+        best_peak = peak if best_peak is None else min(best_peak, peak)
+    print(f"{label:<32} {best_time * 1000:9.1f} ms {best_peak / 1024 / 1024:9.1f} MiB")
+
+def main():
+    num_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    
+    with app.app_context():
+        db.create_all()
+        print(f"Seeding {num_jobs} jobs...")
+        seed(num_jobs)
+        
+        active = lambda: Job.query.filter_by(is_active=True).order_by(Job.created_at.desc())
+        scoring_columns = (Job.id, Job.title, Job.company, Job.location, Job.skills_required,
+                           Job.experience_min, Job.salary_min, Job.salary_max)
+        
+        print(f"{'query':<32} {'time':>12} {'peak memory':>13}")
+        measure('jobs_list: full rows', active)
+        measure('jobs_list: card columns', lambda: active().options(load_only(*JOB_CARD_COLUMNS)))
+        measure('recommendations: full rows', lambda: Job.query.filter_by(is_active=True))
+        measure('recommendations: scoring cols', lambda: Job.query.filter_by(is_active=True)
+                .options(load_only(*scoring_columns)))
+
+if __name__ == '__main__':
+    main()
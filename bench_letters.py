@@ -0,0 +1,52 @@
+"""
+Benchmark offer / rejection letter and certificate rendering throughput.
+Documents are rendered in memory: python bench_letters.py [count]
+"""
+from io import BytesIO
+import sys
+import time
+from types import SimpleNamespace
+
+from datetime import datetime
+
+from modules.letter_generator import generate_offer_letter, generate_rejection_letter
+from modules.certificate_generator import render_certificate
+
+def sample_inputs():
+    user = SimpleNamespace(id=1, name='Asha Kumar')
+    job = SimpleNamespace(id=1, title='Backend Developer', company='TechCorp Solutions',
+                          location='Bangalore', job_type='full-time',
+                          salary_min=800000, salary_max=1400000)
+    analysis = {
+        'decision': 'approved',
+        'overall_score': 82,
+        'match_percentage': 75,
+        'ats_score': 68,
+        'matched_skills': ['Python', 'Flask', 'SQL', 'Docker'],
+        'missing_skills': ['Kubernetes', 'AWS'],
+        'feedback': {
+            'strengths': ['Strong Python background', 'Relevant project work'],
+            'improvements': ['Add cloud experience', 'Quantify achievements'],
+            'recommendations': ['Take an AWS course', 'Contribute to open source']
+        }
+    }
+    return user, job, analysis
+
+def run(label, func, count):
+    user, job, analysis = sample_inputs()
+    func(user, job, analysis, output=BytesIO())  # warm-up
+    started = time.perf_counter()
+    for _ in range(count):
+        func(user, job, analysis, output=BytesIO())
+    elapsed = time.perf_counter() - started
+    print(f"{label:<20} {count / elapsed:8.1f} documents/s")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    run('offer letter', generate_offer_letter, count)
+    run('rejection letter', generate_rejection_letter, count)
+    run('certificate', lambda user, job, analysis, output: render_certificate(
+        output, user.name, 'Skill Certification: Python', datetime.now(), 'JOB-SKI-1', score=90), count)
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'job-portal-secret-key-2024'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///database.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///database.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -20,6 +20,53 @@ class Config:
     AUTO_APPROVE_THRESHOLD = 70
     AUTO_REJECT_THRESHOLD = 40
     
+    # Near-duplicate job postings: estimated Jaccard similarity and 'flag' or 'block'
+    DUPLICATE_JOB_THRESHOLD = 0.8
+    DUPLICATE_JOB_ACTION = 'flag'
+    
+    # Decision letters are rendered on first download. With PERSIST_LETTERS they are
+    # cached under UPLOAD_FOLDER up to LETTER_CACHE_MAX_BYTES, otherwise rendered in memory
+    PERSIST_LETTERS = True
+    LETTER_CACHE_MAX_BYTES = 200 * 1024 * 1024
+    
+    # Unreferenced uploads are only garbage-collected once they are this old, so a
+    # file that was just saved but whose row isn't committed yet is never removed
+    STORAGE_GC_GRACE_HOURS = 24
+    
+    # Test certificates are rendered on a background thread in batches of up to
+    # CERTIFICATE_BATCH_SIZE, waiting CERTIFICATE_BATCH_WAIT seconds for a burst to fill one
+    ASYNC_CERTIFICATES = True
+    CERTIFICATE_BATCH_SIZE = 50
+    CERTIFICATE_BATCH_WAIT = 0.2
+    # A process claims certificates before rendering them; certificates whose render
+    # failed or whose process died are retried once the claim is this many seconds old
+    CERTIFICATE_CLAIM_TIMEOUT = 300
+    
+    # SQLite: write-ahead logging lets readers run alongside the single writer, and
+    # writers wait up to SQLITE_BUSY_TIMEOUT ms for the write lock instead of failing
+    SQLITE_WAL = True
+    SQLITE_BUSY_TIMEOUT = 30000
+    
+    # Social feed: each user's timeline keeps about the newest TIMELINE_LENGTH post IDs.
+    # Posts by users with more than TIMELINE_FANOUT_LIMIT connections are not copied
+    # into timelines but merged in when the feed is read
+    TIMELINE_LENGTH = 500
+    TIMELINE_FANOUT_LIMIT = 1000
+    
+    # Like counts are buffered in memory and written every LIKE_FLUSH_INTERVAL seconds
+    WRITE_BEHIND_LIKES = True
+    LIKE_FLUSH_INTERVAL = 5
+    
+    # People-you-may-know graph is rebuilt from the database after this many seconds
+    SUGGESTION_GRAPH_TTL = 600
+    
+    # Trending skills: a mention counts half as much after TRENDING_HALF_LIFE_HOURS.
+    # On startup the last TRENDING_WARMUP_DAYS of jobs, endorsements and posts are replayed,
+    # then rows committed by any process are picked up every TRENDING_POLL_SECONDS
+    TRENDING_HALF_LIFE_HOURS = 48
+    TRENDING_WARMUP_DAYS = 14
+    TRENDING_POLL_SECONDS = 30
+    
     # Babel configuration
     LANGUAGES = ['en', 'hi', 'ta']
     BABEL_DEFAULT_LOCALE = 'en'
@@ -1,8 +1,17 @@
 # Models module - all database models
 from extensions import db
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from datetime import datetime
 
+SNIPPET_LENGTH = 150
+
+def make_snippet(text, length=SNIPPET_LENGTH):
+    """Shortened description shown on job cards"""
+    if not text:
+        return text
+    return text[:length] + '...' if len(text) > length else text
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -16,6 +25,8 @@ class User(UserMixin, db.Model):
     face_encoding = db.Column(db.Text)  # JSON encoded face data
     company_name = db.Column(db.String(100))  # For employers
     preferred_language = db.Column(db.String(10), default='en')  # 'en', 'hi', 'ta'
+    connection_count = db.Column(db.Integer, default=0, server_default='0')  # Accepted connections
+    calendar_token = db.Column(db.String(64), unique=True, index=True)  # Secret in the calendar feed URL
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -76,6 +87,7 @@ class Job(db.Model):
     title = db.Column(db.String(150), nullable=False)
     company = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
+    description_snippet = db.Column(db.String(160))  # Filled from description on write
     requirements = db.Column(db.Text)  # JSON list of requirements
     skills_required = db.Column(db.Text)  # JSON list of skills
     experience_min = db.Column(db.Integer, default=0)
@@ -86,8 +98,26 @@ class Job(db.Model):
     job_type = db.Column(db.String(50))  # 'full-time', 'part-time', 'contract', 'remote'
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    minhash = db.Column(db.String(512))  # Hex encoded MinHash fingerprint of title, company and description
+    duplicate_of = db.Column(db.Integer, db.ForeignKey('job.id'))  # Earlier posting this one repeats
     
     applications = db.relationship('Application', backref='job', lazy=True, cascade='all, delete-orphan')
+    lsh_buckets = db.relationship('JobLSHBucket', lazy=True, cascade='all, delete-orphan')
+    
+    @validates('description')
+    def _update_snippet(self, key, value):
+        self.description_snippet = make_snippet(value)
+        return value
+
+class JobLSHBucket(db.Model):
+    """LSH band buckets of each job's MinHash fingerprint, see modules/dedup.py"""
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)  # Band number << 32 | CRC-32 of the band
+    
+    __table_args__ = (
+        db.Index('ix_job_lsh_bucket_bucket', 'bucket', 'job_id'),
+    )
 
 class Application(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -96,12 +126,19 @@ class Application(db.Model):
     status = db.Column(db.String(20), default='pending')  # 'pending', 'approved', 'rejected', 'under_review'
     ai_score = db.Column(db.Integer)
     match_percentage = db.Column(db.Integer)
+    ats_score = db.Column(db.Integer)
     skills_match = db.Column(db.Text)  # JSON
     missing_skills = db.Column(db.Text)  # JSON
     feedback = db.Column(db.Text)  # JSON with AI feedback
     letter_path = db.Column(db.String(200))
     applied_at = db.Column(db.DateTime, default=datetime.utcnow)
     decided_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Applications of a job by score, with and without a status filter
+        db.Index('ix_application_job_status_score', 'job_id', 'status', 'ai_score'),
+        db.Index('ix_application_job_score', 'job_id', 'ai_score', 'id'),
+    )
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -129,6 +166,9 @@ class Like(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_like_post_user', 'post_id', 'user_id', unique=True,
+                               info={'dedupe': 'flask social dedupe-likes'}),)
 
 class Connection(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -150,7 +190,14 @@ class PsychologicalTest(db.Model):
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     questions_json = db.Column(db.Text, nullable=False)  # JSON list of questions
+    version = db.Column(db.Integer, default=1, server_default='1')  # Bumped when questions change
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @validates('questions_json')
+    def _bump_version(self, key, value):
+        # Parsed questions are cached per (id, version), see modules/test_cache.py
+        self.version = (self.version or 0) + 1
+        return value
 
 class PsychologicalTestResult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -159,13 +206,23 @@ class PsychologicalTestResult(db.Model):
     score = db.Column(db.Integer)
     analysis = db.Column(db.Text)  # Detailed analysis text
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_psychological_test_result_user_test', 'user_id', 'test_id'),
+    )
 
 class SkillTest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     skill_name = db.Column(db.String(50), nullable=False)
     level = db.Column(db.String(20))  # 'beginner', 'intermediate', 'advanced'
     questions_json = db.Column(db.Text, nullable=False)
+    version = db.Column(db.Integer, default=1, server_default='1')  # Bumped when questions change
     duration_minutes = db.Column(db.Integer, default=30)
+    
+    @validates('questions_json')
+    def _bump_version(self, key, value):
+        self.version = (self.version or 0) + 1
+        return value
 
 class SkillTestResult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -174,6 +231,10 @@ class SkillTestResult(db.Model):
     score = db.Column(db.Integer)
     is_passed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_skill_test_result_user_test', 'user_id', 'test_id'),
+    )
 
 class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -187,13 +248,29 @@ class Event(db.Model):
     start_date = db.Column(db.DateTime)
     end_date = db.Column(db.DateTime)
     image_url = db.Column(db.String(200))
+    capacity = db.Column(db.Integer)  # Maximum registrations, None for unlimited
+    registered_count = db.Column(db.Integer, default=0, server_default='0')  # Confirmed registrations
+    waitlist_enabled = db.Column(db.Boolean, default=False, server_default='0')  # Waitlist once full
+    is_archived = db.Column(db.Boolean, default=False, server_default='0')  # Set once the event is over
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Partial indexes over the events that haven't been archived, so they stay small
+    __table_args__ = (
+        db.Index('ix_event_upcoming_start', 'start_date', sqlite_where=db.text('is_archived = 0')),
+        db.Index('ix_event_upcoming_type_start', 'event_type', 'start_date', sqlite_where=db.text('is_archived = 0')),
+    )
 
 class EventRegistration(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), default='registered', server_default='registered')  # 'registered', 'waitlisted'
     registered_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_event_registration_event_user', 'event_id', 'user_id', unique=True,
+                 info={'dedupe': 'flask events dedupe-registrations'}),
+    )
 
 class Certificate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -203,3 +280,42 @@ class Certificate(db.Model):
     title = db.Column(db.String(200))
     file_path = db.Column(db.String(200))
     issued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)  # Set by the process rendering the PDF, see modules/certificate_queue.py
+
+class StoredFile(db.Model):
+    """Manifest of files kept under UPLOAD_FOLDER, see modules/storage.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(300), unique=True, nullable=False)  # Relative to UPLOAD_FOLDER
+    kind = db.Column(db.String(20), nullable=False, index=True)  # 'resumes', 'profiles', 'certificates', 'letters'
+    size = db.Column(db.Integer, default=0)
+    references = db.Column(db.Integer, default=0)  # Refreshed by each garbage collection
+    stored_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TestScoreBucket(db.Model):
+    """Number of results per test and score, kept up to date on every submission"""
+    id = db.Column(db.Integer, primary_key=True)
+    test_type = db.Column(db.String(20), nullable=False)  # 'psychology', 'skill'
+    test_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Integer, nullable=False)  # Exact score, 0 or more
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_test_score_bucket_test_score', 'test_type', 'test_id', 'score', unique=True),
+    )
+
+class FeedVersion(db.Model):
+    """Change counter per feed, so conditional GETs are answered without reading the feed's rows
+    and per-process caches know when to reload"""
+    name = db.Column(db.String(100), primary_key=True)  # 'events', 'my-events:<user_id>', 'tests', 'test-results:<user_id>'
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TimelineEntry(db.Model):
+    """A post in a user's feed, written when the post is created (see modules/timeline.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_timeline_entry_user_post', 'user_id', 'post_id', unique=True),
+    )
@@ -0,0 +1,195 @@
+"""
+Bulk Grading Module
+Grades JSONL files of offline skill test submissions in batches and
+bulk-inserts the results
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.orm import defer
+
+from extensions import db
+from models import User, SkillTest, SkillTestResult, Certificate
+from modules.job_import import iter_rows, BATCH_SIZE, MAX_REPORTED_ERRORS
+from modules.test_cache import get_test, grade_many, record_results, PASS_SCORE
+from modules.score_stats import record_scores
+
+def _parse_answers(value, question_count):
+    """Answers as a list, or a {"q_0": "A", ...} mapping as submitted by the web form"""
+    if isinstance(value, list):
+        if len(value) > question_count:
+            raise ValueError(f"More answers than the test's {question_count} questions")
+        return [str(a) if a is not None else '' for a in value]
+    if isinstance(value, dict):
+        answers = [''] * question_count
+        for key, answer in value.items():
+            if not str(key).startswith('q_') or not str(key)[2:].isdigit():
+                raise ValueError(f"Unknown answer key '{key}'")
+            index = int(str(key)[2:])
+            if index >= question_count:
+                raise ValueError(f"Answer key '{key}' is beyond the test's {question_count} questions")
+            answers[index] = str(answer) if answer is not None else ''
+        return answers
+    raise ValueError("'answers' must be a list or an object")
+
+def _is_id(value):
+    # JSON true/false are ints in Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError("'completed_at' must be an ISO 8601 timestamp")
+
+def _grade_batch(batch, tests):
+    """Grade, insert and return (graded, certificate ids) for a list of validated submissions"""
+    by_test = defaultdict(list)
+    for submission in batch:
+        by_test[submission['test_id']].append(submission)
+
+    now = datetime.utcnow()
+    rows = []
+    for test_id, submissions in by_test.items():
+        test = tests[test_id]
+        parsed = get_test(SkillTest, test.id, test.version)
+        scores = grade_many(parsed, [s['answers'] for s in submissions])
+        record_scores('skill', test_id, scores.tolist())
+        for submission, score in zip(submissions, scores.tolist()):
+            rows.append({
+                'user_id': submission['user_id'],
+                'test_id': test_id,
+                'score': score,
+                'is_passed': score >= PASS_SCORE,
+                'completed_at': submission['completed_at'] or now
+            })
+
+    result_ids = db.session.scalars(
+        insert(SkillTestResult).returning(SkillTestResult.id, sort_by_parameter_order=True), rows
+    ).all()
+
+    certificates = [{
+        'user_id': row['user_id'],
+        'cert_type': 'skill',
+        'reference_id': result_id,
+        'title': f"Skill Certification: {tests[row['test_id']].skill_name}",
+        'issued_at': now
+    } for row, result_id in zip(rows, result_ids) if row['is_passed']]
+
+    certificate_ids = []
+    if certificates:
+        certificate_ids = db.session.scalars(
+            insert(Certificate).returning(Certificate.id, sort_by_parameter_order=True), certificates
+        ).all()
+    record_results(*sorted({row['user_id'] for row in rows}))
+    db.session.commit()
+    return len(rows), certificate_ids
+
+def grade_submissions(stream, batch_size=BATCH_SIZE, render_inline=False):
+    """Grade a JSONL stream of {"user_id" or "email", "test_id", "answers", "completed_at"?}.
+
+    Every batch is graded per test with one array comparison, inserted with
+    executemany and committed; certificates for passes are queued after
+    each commit, or rendered before the next batch with render_inline
+    (for callers such as the CLI that exit before a background worker
+    could finish). Returns a summary with counts and per-row errors.
+    """
+    from modules.certificate_queue import enqueue_many, render_many
+
+    tests = {}
+    question_counts = {}
+    users_by_email = {}
+    user_ids = set()
+    graded = 0
+    passed = 0
+    failed = 0
+    errors = []
+    pending = []
+
+    def flush(rows):
+        nonlocal graded, passed
+        # Resolve the batch's users with one query per identifier type
+        emails = {r['email'] for r in rows if r['user_id'] is None and r['email'] not in users_by_email}
+        if emails:
+            users_by_email.update(db.session.query(User.email, User.id).filter(User.email.in_(emails)))
+        ids = {r['user_id'] for r in rows if r['user_id'] is not None} - user_ids
+        if ids:
+            user_ids.update(db.session.scalars(db.select(User.id).filter(User.id.in_(ids))))
+        
+        valid = []
+        for row in rows:
+            if row['user_id'] is None:
+                row['user_id'] = users_by_email.get(row['email'])
+                if row['user_id'] is None:
+                    report(row['line'], f"Unknown user '{row['email']}'")
+                    continue
+            elif row['user_id'] not in user_ids:
+                report(row['line'], f"Unknown user {row['user_id']}")
+                continue
+            valid.append(row)
+        if not valid:
+            return
+        count, certificate_ids = _grade_batch(valid, tests)
+        graded += count
+        passed += len(certificate_ids)
+        if render_inline:
+            render_many(certificate_ids)
+        else:
+            enqueue_many(certificate_ids)
+
+    def report(line_number, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': line_number, 'error': message})
+
+    for line_number, data in iter_rows(stream, 'jsonl'):
+        try:
+            if not isinstance(data, dict):
+                raise ValueError("Invalid JSON object")
+            test_id = data.get('test_id')
+            if not _is_id(test_id):
+                raise ValueError("'test_id' is required")
+            if test_id not in tests:
+                tests[test_id] = SkillTest.query.options(defer(SkillTest.questions_json)).get(test_id)
+            if tests[test_id] is None:
+                raise ValueError(f"Skill test {test_id} not found")
+            if test_id not in question_counts:
+                test = tests[test_id]
+                parsed = get_test(SkillTest, test.id, test.version)
+                question_counts[test_id] = len(parsed.questions) if parsed else 0
+            if not question_counts[test_id]:
+                raise ValueError(f"Skill test {test_id} has no questions")
+            user_id = data.get('user_id')
+            email = (data.get('email') or '').strip() or None
+            if user_id is not None and not _is_id(user_id):
+                raise ValueError("'user_id' must be a whole number")
+            if user_id is None and email is None:
+                raise ValueError("'user_id' or 'email' is required")
+            pending.append({
+                'line': line_number,
+                'user_id': user_id,
+                'email': email,
+                'test_id': test_id,
+                'answers': _parse_answers(data.get('answers'), question_counts[test_id]),
+                'completed_at': _parse_time(data.get('completed_at'))
+            })
+        except ValueError as e:
+            report(line_number, str(e))
+            continue
+
+        if len(pending) >= batch_size:
+            flush(pending)
+            pending = []
+
+    if pending:
+        flush(pending)
+
+    return {
+        'graded': graded,
+        'passed': passed,
+        'failed': failed,
+        'errors': errors
+    }
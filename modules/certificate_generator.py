@@ -0,0 +1,52 @@
+"""
+Certificate Generator Module
+Draws test completion certificates
+"""
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+
+# Fixed parts of every certificate as (font, size, inches from top, text)
+CERTIFICATE_HEADINGS = (
+    ("Helvetica-Bold", 30, 2, "CERTIFICATE OF COMPLETION"),
+    ("Helvetica", 18, 3, "This is to certify that"),
+    ("Helvetica", 18, 5, "has successfully completed the"),
+)
+
+def _draw_template(c):
+    """Border and headings shared by every certificate, kept as a form XObject"""
+    c.beginForm('certificate_template')
+    c.setStrokeColor(colors.gold)
+    c.setLineWidth(5)
+    c.rect(0.5*inch, 0.5*inch, PAGE_WIDTH-1*inch, PAGE_HEIGHT-1*inch)
+    for font, size, offset, text in CERTIFICATE_HEADINGS:
+        c.setFont(font, size)
+        c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT - offset*inch, text)
+    c.endForm()
+
+def render_certificate(output, name, title, issued_at, certificate_id, score=None):
+    """Draw a certificate into output (a path or file-like object)"""
+    c = canvas.Canvas(output, pagesize=letter)
+    _draw_template(c)
+    c.doForm('certificate_template')
+
+    # Per-certificate text
+    c.setFont("Helvetica-Bold", 24)
+    c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT - 4*inch, name.upper())
+
+    c.setFont("Helvetica-Bold", 20)
+    c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT - 6*inch, title)
+
+    if score is not None:
+        c.setFont("Helvetica", 16)
+        c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT - 6.5*inch, f"with a score of {score}%")
+
+    c.setFont("Helvetica", 14)
+    c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT - 8*inch, f"Date: {issued_at.strftime('%B %d, %Y')}")
+    c.drawCentredString(PAGE_WIDTH/2, PAGE_HEIGHT - 8.5*inch, f"Certificate ID: {certificate_id}")
+
+    c.save()
+    return output
@@ -0,0 +1,189 @@
+"""
+Certificate Queue Module
+Renders test certificates on a background thread so submissions don't wait
+for the PDF. Certificates queued in a burst are rendered and committed in batches.
+
+Each certificate is claimed with a conditional UPDATE before it's rendered, so
+with several worker processes every PDF is rendered once. PDFs are rendered
+outside any transaction and the batch is then written in one short one, so
+other submissions' commits can't make the write fail. A failed render
+releases its claim for the next sweep; certificates claimed by a process
+that died are picked up once the claim is CERTIFICATE_CLAIM_TIMEOUT seconds old.
+"""
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from datetime import datetime, timedelta
+import queue
+import threading
+import time
+
+from extensions import db
+from models import User, SkillTestResult, Certificate
+from modules.certificate_generator import render_certificate
+
+# Tries at writing a rendered batch when the database is busy, the first retry after WRITE_BACKOFF seconds
+WRITE_ATTEMPTS = 5
+WRITE_BACKOFF = 0.1
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+def certificate_filename(cert_type, reference_id):
+    return f"cert_{cert_type}_{reference_id}.pdf"
+
+def _claimable():
+    stale = datetime.utcnow() - timedelta(seconds=current_app.config['CERTIFICATE_CLAIM_TIMEOUT'])
+    return Certificate.file_path.is_(None) & (Certificate.claimed_at.is_(None) | (Certificate.claimed_at < stale))
+
+def claim(certificate_ids):
+    """Claim the given certificates that have no file and no live claim; returns the claimed IDs"""
+    claimed = db.session.scalars(
+        Certificate.__table__.update()
+        .where(Certificate.id.in_(set(certificate_ids)), _claimable())
+        .values(claimed_at=datetime.utcnow())
+        .returning(Certificate.id)
+    ).all()
+    db.session.commit()
+    return claimed
+
+def _write(rendered, failed):
+    """Record rendered files and release the claims of failed renders, in one transaction"""
+    from modules.storage import register
+
+    for attempt in range(WRITE_ATTEMPTS):
+        try:
+            for cert_id, relative in rendered.items():
+                db.session.query(Certificate).filter(Certificate.id == cert_id)\
+                    .update({'file_path': register(relative, 'certificates')}, synchronize_session=False)
+            if failed:
+                db.session.query(Certificate).filter(Certificate.id.in_(failed))\
+                    .update({'claimed_at': None}, synchronize_session=False)
+            db.session.commit()
+            return
+        except OperationalError:
+            db.session.rollback()
+            if attempt == WRITE_ATTEMPTS - 1:
+                raise
+            time.sleep(WRITE_BACKOFF * 2 ** attempt)
+
+def render_batch(certificate_ids):
+    """Claim and render the given certificates that have no file yet, then commit them together.
+    A certificate that fails to render is logged and released for a later retry."""
+    from modules.storage import reserve
+
+    claimed = claim(certificate_ids)
+    if not claimed:
+        return 0
+    rows = db.session.query(Certificate.id, Certificate.cert_type, Certificate.reference_id,
+                            Certificate.title, Certificate.issued_at, User.name)\
+        .join(User, Certificate.user_id == User.id)\
+        .filter(Certificate.id.in_(claimed))\
+        .all()
+
+    skill_result_ids = [row.reference_id for row in rows if row.cert_type == 'skill']
+    scores = dict(db.session.query(SkillTestResult.id, SkillTestResult.score)
+                  .filter(SkillTestResult.id.in_(skill_result_ids))) if skill_result_ids else {}
+    # End the read transaction, rendering can take a while
+    db.session.commit()
+
+    rendered, failed = {}, []
+    for row in rows:
+        try:
+            path, relative = reserve('certificates', certificate_filename(row.cert_type, row.reference_id))
+            render_certificate(path, row.name, row.title, row.issued_at,
+                               f"JOB-{row.cert_type[:3].upper()}-{row.reference_id}",
+                               score=scores.get(row.reference_id) if row.cert_type == 'skill' else None)
+            rendered[row.id] = relative
+        except Exception:
+            current_app.logger.exception("Failed to render certificate %s", row.id)
+            failed.append(row.id)
+
+    try:
+        _write(rendered, failed)
+    except Exception:
+        # Let the next sweep retry the batch instead of waiting for the claims to expire
+        db.session.rollback()
+        db.session.query(Certificate).filter(Certificate.id.in_(claimed))\
+            .update({'claimed_at': None}, synchronize_session=False)
+        db.session.commit()
+        raise
+    return len(rendered)
+
+def _next_batch(size, wait, idle):
+    """Wait up to `idle` seconds for one certificate, then collect whatever else
+    arrives within `wait` seconds. Empty if nothing was queued."""
+    try:
+        batch = [_queue.get(timeout=idle)]
+    except queue.Empty:
+        return []
+    deadline = time.monotonic() + wait
+    while len(batch) < size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def _run(app):
+    size = app.config['CERTIFICATE_BATCH_SIZE']
+    batch, swept = [], False
+    while True:
+        with app.app_context():
+            try:
+                if not batch:
+                    # Nothing queued: certificates left unrendered by a failed render or
+                    # by a process that died, once their claim has expired
+                    batch = db.session.scalars(
+                        db.select(Certificate.id).where(_claimable()).order_by(Certificate.id).limit(size)
+                    ).all()
+                    swept = True
+                if batch:
+                    render_batch(batch)
+            except Exception:
+                app.logger.exception("Failed to render certificates %s", batch)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        # Keep sweeping while a full batch turned up, otherwise wait for new certificates
+        if swept and len(batch) == size:
+            batch = []
+        else:
+            batch = _next_batch(size, app.config['CERTIFICATE_BATCH_WAIT'], app.config['CERTIFICATE_CLAIM_TIMEOUT'])
+        swept = False
+
+def _ensure_worker(app):
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, args=(app,), name='certificate-worker', daemon=True)
+            _worker.start()
+
+def enqueue(certificate_id):
+    """Queue a committed certificate for rendering.
+
+    Without ASYNC_CERTIFICATES the certificate is rendered immediately.
+    """
+    if not current_app.config['ASYNC_CERTIFICATES']:
+        render_batch([certificate_id])
+        return
+    _ensure_worker(current_app._get_current_object())
+    _queue.put(certificate_id)
+
+def render_many(certificate_ids):
+    """Render committed certificates now, in batches of CERTIFICATE_BATCH_SIZE"""
+    batch_size = current_app.config['CERTIFICATE_BATCH_SIZE']
+    for start in range(0, len(certificate_ids), batch_size):
+        render_batch(certificate_ids[start:start + batch_size])
+
+def enqueue_many(certificate_ids):
+    """Queue many committed certificates, e.g. from a bulk grading run"""
+    if not current_app.config['ASYNC_CERTIFICATES']:
+        render_many(certificate_ids)
+        return
+    _ensure_worker(current_app._get_current_object())
+    for certificate_id in certificate_ids:
+        _queue.put(certificate_id)
@@ -0,0 +1,286 @@
+"""
+Connection Graph Module
+Accepted connections held in memory as a compressed sparse row (CSR) graph,
+for "people you may know" suggestions ranked by mutual connections and
+skill overlap. Accepts and removals update the graph in place; it's rebuilt
+from the database on a background thread every SUGGESTION_GRAPH_TTL seconds
+to pick up changes made by other processes.
+"""
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select, union
+import threading
+import time
+import numpy as np
+
+from extensions import db
+from models import User, Connection, Skill
+
+# A full skill match is worth this many mutual connections
+SKILL_WEIGHT = 2.0
+
+# Candidates with the most mutual connections that get skill-scored
+CANDIDATE_POOL = 200
+
+# Users sharing a skill considered even without mutual connections
+SKILL_CANDIDATES = 100
+
+# Incremental changes kept beside the CSR arrays before they're merged in
+COMPACT_THRESHOLD = 10000
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+class ConnectionGraph:
+    """Undirected graph over user IDs: neighbours of u are indices[indptr[u]:indptr[u + 1]]"""
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+        self._added = {}
+        self._removed = {}
+        self._changes = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_edges(cls, src, dst, size=None):
+        """Build from parallel arrays of user IDs; direction and duplicates don't matter"""
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        keep = src != dst
+        rows = np.concatenate([src[keep], dst[keep]])
+        cols = np.concatenate([dst[keep], src[keep]])
+        size = max(size or 0, int(rows.max()) + 1 if len(rows) else 0)
+
+        # Sorting the combined key orders by row, then column, and lets duplicates drop out
+        keys = np.unique(rows * size + cols)
+        rows, cols = keys // size, keys % size
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+        return cls(indptr, cols.astype(np.int32))
+
+    @property
+    def size(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def _base(self, user_id):
+        if user_id >= self.size:
+            return _EMPTY
+        return self.indices[self.indptr[user_id]:self.indptr[user_id + 1]]
+
+    def neighbors(self, user_id):
+        base = self._base(user_id)
+        with self._lock:
+            added = self._added.get(user_id)
+            removed = self._removed.get(user_id)
+            if not added and not removed:
+                return base
+            merged = set(base.tolist())
+            merged -= removed or set()
+            merged |= added or set()
+        return np.fromiter(sorted(merged), dtype=np.int32, count=len(merged))
+
+    def _connected_in_base(self, a, b):
+        row = self._base(a)
+        position = np.searchsorted(row, b)
+        return position < len(row) and row[position] == b
+
+    def add_edge(self, a, b):
+        if a == b:
+            return
+        with self._lock:
+            for u, v in ((a, b), (b, a)):
+                self._removed.get(u, set()).discard(v)
+                if not self._connected_in_base(u, v):
+                    self._added.setdefault(u, set()).add(v)
+            self._changes += 1
+        self._maybe_compact()
+
+    def remove_edge(self, a, b):
+        with self._lock:
+            for u, v in ((a, b), (b, a)):
+                self._added.get(u, set()).discard(v)
+                if self._connected_in_base(u, v):
+                    self._removed.setdefault(u, set()).add(v)
+            self._changes += 1
+        self._maybe_compact()
+
+    def edges(self):
+        """(src, dst) arrays of every directed edge, incremental changes included"""
+        with self._lock:
+            rows = np.repeat(np.arange(self.size, dtype=np.int64), np.diff(self.indptr))
+            cols = self.indices.astype(np.int64)
+            removed = [(u, v) for u, vs in self._removed.items() for v in vs]
+            added = [(u, v) for u, vs in self._added.items() for v in vs]
+        if removed:
+            size = max(self.size, 1)
+            drop = np.array([u * size + v for u, v in removed], dtype=np.int64)
+            keep = ~np.isin(rows * size + cols, drop)
+            rows, cols = rows[keep], cols[keep]
+        if added:
+            extra = np.array(added, dtype=np.int64)
+            rows = np.concatenate([rows, extra[:, 0]])
+            cols = np.concatenate([cols, extra[:, 1]])
+        return rows, cols
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._changes < COMPACT_THRESHOLD:
+                return
+            rebuilt = ConnectionGraph.from_edges(*self.edges(), size=self.size)
+            self.indptr, self.indices = rebuilt.indptr, rebuilt.indices
+            self._added, self._removed, self._changes = {}, {}, 0
+
+    def mutual_counts(self, user_id):
+        """(candidate IDs, mutual connection counts) for friends of friends that aren't friends yet"""
+        friends = self.neighbors(user_id)
+        if not len(friends):
+            return _EMPTY, _EMPTY
+        reached = np.concatenate([self.neighbors(int(friend)) for friend in friends])
+        candidates, counts = np.unique(reached, return_counts=True)
+        keep = (candidates != user_id) & ~np.isin(candidates, friends)
+        return candidates[keep], counts[keep]
+
+    def candidate_pool(self, user_id):
+        """The CANDIDATE_POOL friends of friends with the most mutual connections"""
+        candidates, mutuals = self.mutual_counts(user_id)
+        if len(candidates) > CANDIDATE_POOL:
+            top = np.argpartition(-mutuals, CANDIDATE_POOL - 1)[:CANDIDATE_POOL]
+            candidates, mutuals = candidates[top], mutuals[top]
+        return candidates, mutuals
+
+    def rank(self, user_id, k, skills=None, extra_candidates=(), exclude=(), pool=None):
+        """Top-k [(candidate, score)] by mutual connections plus SKILL_WEIGHT times the
+        Jaccard overlap of skill sets. `skills` maps user IDs to sets of skill names."""
+        candidates, mutuals = pool if pool is not None else self.candidate_pool(user_id)
+
+        scores = dict(zip(candidates.tolist(), mutuals.astype(float).tolist()))
+        friends = set(self.neighbors(user_id).tolist())
+        for candidate in extra_candidates:
+            if candidate != user_id and candidate not in friends:
+                scores.setdefault(candidate, 0.0)
+        for candidate in exclude:
+            scores.pop(candidate, None)
+
+        if skills:
+            mine = skills.get(user_id, set())
+            for candidate in scores:
+                theirs = skills.get(candidate, set())
+                if mine and theirs:
+                    scores[candidate] += SKILL_WEIGHT * len(mine & theirs) / len(mine | theirs)
+
+        ranked = [(candidate, score) for candidate, score in scores.items() if score > 0]
+        if len(ranked) > k:
+            values = np.array([score for _, score in ranked])
+            top = np.argpartition(-values, k - 1)[:k]
+            ranked = [ranked[i] for i in top]
+        return sorted(ranked, key=lambda item: (-item[1], item[0]))
+
+# Stands in for the graph until the first build finishes
+_EMPTY_GRAPH = ConnectionGraph.from_edges([], [])
+
+_graph = None
+_built_at = 0.0
+_rebuilding = False
+_replay = []
+_graph_lock = threading.Lock()
+
+# Connections read per round trip while building
+EDGE_CHUNK = 50000
+
+def build_graph():
+    """A new graph of every accepted connection, read from the database in chunks"""
+    src, dst = [], []
+    result = db.session.execute(
+        select(Connection.user_id, Connection.connected_user_id).where(Connection.status == 'accepted')
+    ).yield_per(EDGE_CHUNK)
+    for rows in result.partitions():
+        chunk = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        src.append(chunk[:, 0])
+        dst.append(chunk[:, 1])
+    max_id = db.session.query(func.max(User.id)).scalar() or 0
+    if not src:
+        return ConnectionGraph.from_edges([], [], size=max_id + 1)
+    return ConnectionGraph.from_edges(np.concatenate(src), np.concatenate(dst), size=max_id + 1)
+
+def _rebuild(app):
+    global _graph, _built_at, _rebuilding
+    try:
+        with app.app_context():
+            try:
+                graph = build_graph()
+            finally:
+                db.session.remove()
+        with _graph_lock:
+            # Accepts and removals made while the connections were being read
+            for added, user_a, user_b in _replay:
+                (graph.add_edge if added else graph.remove_edge)(user_a, user_b)
+            _graph = graph
+            _built_at = time.monotonic()
+    except Exception:
+        app.logger.exception("Failed to build the connection graph")
+    finally:
+        with _graph_lock:
+            _rebuilding = False
+            _replay.clear()
+
+def load_graph():
+    """The current graph, or None until the first build finishes.
+
+    A missing or SUGGESTION_GRAPH_TTL-old graph is rebuilt on a background
+    thread and swapped in when ready; requests keep using the old one.
+    """
+    global _rebuilding
+    with _graph_lock:
+        stale = _graph is None or time.monotonic() - _built_at > current_app.config['SUGGESTION_GRAPH_TTL']
+        if stale and not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild, args=(current_app._get_current_object(),),
+                             name='connection-graph-builder', daemon=True).start()
+        return _graph
+
+def _record(added, user_a, user_b):
+    with _graph_lock:
+        if _rebuilding:
+            _replay.append((added, user_a, user_b))
+        graph = _graph
+    if graph is not None:
+        (graph.add_edge if added else graph.remove_edge)(user_a, user_b)
+
+def connection_added(user_a, user_b):
+    _record(True, user_a, user_b)
+
+def connection_removed(user_a, user_b):
+    _record(False, user_a, user_b)
+
+def suggest(user_id, k=5):
+    """Users the given user may know, best first, in three queries"""
+    graph = load_graph() or _EMPTY_GRAPH
+
+    # Anyone with a connection or request either way is already known
+    outgoing = select(Connection.connected_user_id).where(Connection.user_id == user_id)
+    incoming = select(Connection.user_id).where(Connection.connected_user_id == user_id)
+    known = set(db.session.scalars(union(outgoing, incoming)))
+
+    # Skills of the user, of the graph candidates and of users sharing a skill, together
+    pool = graph.candidate_pool(user_id)
+    my_skills = select(func.lower(Skill.name)).where(Skill.user_id == user_id)
+    shared = select(Skill.user_id).where(func.lower(Skill.name).in_(my_skills), Skill.user_id != user_id)\
+        .distinct().limit(SKILL_CANDIDATES)
+    skills = {}
+    for owner, name in db.session.query(Skill.user_id, func.lower(Skill.name))\
+            .filter(or_(Skill.user_id.in_(set(pool[0].tolist()) | {user_id}), Skill.user_id.in_(shared))):
+        skills.setdefault(owner, set()).add(name)
+
+    ranked = [uid for uid, _ in graph.rank(user_id, k, skills=skills, extra_candidates=skills.keys(),
+                                           exclude=known, pool=pool)]
+
+    # The ranked users, topped up with other job seekers when there aren't enough
+    fallback = and_(User.id.not_in(known | {user_id}), User.role == 'seeker')
+    users = User.query.filter(or_(User.id.in_(ranked), fallback))\
+        .order_by(case((User.id.in_(ranked), 0), else_=1), User.id)\
+        .limit(k).all()
+    position = {uid: index for index, uid in enumerate(ranked)}
+    return sorted(users, key=lambda user: position.get(user.id, len(ranked)))
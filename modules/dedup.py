@@ -0,0 +1,101 @@
+"""
+Job De-duplication Module
+MinHash fingerprints of job postings and an LSH index to find near-duplicates
+"""
+from collections import defaultdict
+import re
+import zlib
+
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+# Universal hashing h(x) = (a * x + b) mod p with p = 2^31 - 1 keeps every
+# product below 2^62, so the whole signature is computed in uint64 without overflow
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(20240101)
+_A = _rng.randint(1, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+
+_WORD_RE = re.compile(r'\w+')
+
+def shingles(text):
+    """Return the set of hashed word shingles for a piece of text"""
+    words = _WORD_RE.findall((text or '').lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = [' '.join(words)] if words else []
+    else:
+        grams = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return {zlib.crc32(g.encode('utf-8')) for g in grams}
+
+def job_text(title, company, description):
+    return f"{title or ''} {company or ''} {description or ''}"
+
+def compute_signature(text):
+    """MinHash signature of the text as a uint32 array of NUM_PERM values"""
+    hashed = shingles(text)
+    if not hashed:
+        return np.full(NUM_PERM, (1 << 31) - 1, dtype=np.uint32)
+    x = np.fromiter(hashed, dtype=np.uint64, count=len(hashed)) % _PRIME
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+def encode_signature(signature):
+    return signature.astype('<u4').tobytes().hex()
+
+def decode_signature(value):
+    return np.frombuffer(bytes.fromhex(value), dtype='<u4')
+
+def job_fingerprint(title, company, description):
+    """Encoded MinHash fingerprint stored in Job.minhash"""
+    return encode_signature(compute_signature(job_text(title, company, description)))
+
+def band_buckets(signature):
+    """One integer per LSH band, stored in JobLSHBucket so candidates are found with an index lookup"""
+    return [(band << 32) | zlib.crc32(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].astype('<u4').tobytes())
+            for band in range(BANDS)]
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+class LSHIndex:
+    """Banded locality-sensitive hash index over MinHash signatures"""
+
+    def __init__(self):
+        self.buckets = defaultdict(list)
+        self.signatures = {}
+
+    def _band_keys(self, signature):
+        for band in range(BANDS):
+            start = band * ROWS_PER_BAND
+            yield band, signature[start:start + ROWS_PER_BAND].tobytes()
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self.buckets[band_key].append(key)
+
+    def query(self, signature, threshold):
+        """Return [(key, similarity)] for indexed entries at or above threshold, best first"""
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+
+        matches = []
+        for key in candidates:
+            score = similarity(signature, self.signatures[key])
+            if score >= threshold:
+                matches.append((key, score))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches
+
+def build_index(rows):
+    """Build an LSHIndex from (job_id, encoded_fingerprint) rows"""
+    index = LSHIndex()
+    for job_id, fingerprint in rows:
+        if fingerprint:
+            index.add(job_id, decode_signature(fingerprint))
+    return index
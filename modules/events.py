@@ -1,49 +1,192 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, abort
+from sqlalchemy import event as orm_event
 from flask_login import login_required, current_user
-from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import click
 import json
 import os
+import secrets
+import threading
+import time
 
 from extensions import db
 from models import Event, EventRegistration, User
+from modules.feeds import bump_feed_version, feed_version
 
-events_bp = Blueprint('events_bp', __name__, url_prefix='/events')
+events_bp = Blueprint('events_bp', __name__, url_prefix='/events', cli_group='events')
 
-@events_bp.route('/')
-def index():
-    search = request.args.get('search', '')
-    location = request.args.get('location', '')
-    event_type = request.args.get('type', '')
-    is_internship = request.args.get('is_internship') == 'true'
+EVENTS_PER_PAGE = 24
+FEED_BATCH_SIZE = 500
+
+# FeedVersion names of the public calendar and of each user's registrations
+CALENDAR_FEED = 'events'
+
+def my_events_feed(user_id):
+    return f'my-events:{user_id}'
+
+def _calendar_changed(mapper, connection, target):
+    bump_feed_version(CALENDAR_FEED, connection)
+
+for _change in ('after_insert', 'after_update', 'after_delete'):
+    orm_event.listen(Event, _change, _calendar_changed)
+
+def archive_past_events(now=None):
+    """Mark events that have ended as archived so they drop out of the upcoming indexes.
+    Run periodically with `flask events archive`, e.g. from cron."""
+    now = now or datetime.utcnow()
+    result = db.session.execute(
+        Event.__table__.update()
+        .where(Event.is_archived == False, func.coalesce(Event.end_date, Event.start_date) < now)
+        .values(is_archived=True)
+    )
+    if result.rowcount:
+        bump_feed_version(CALENDAR_FEED)
+    db.session.commit()
+    return result.rowcount
+
+def paginate_events(start=None, end=None, event_type=None, search=None, location=None,
+                    is_internship=False, after=None, limit=EVENTS_PER_PAGE):
+    """Keyset-paginate upcoming (not archived) events by (start_date, id).
     
-    query = Event.query
+    `start` / `end` bound start_date, `after` is the cursor returned for the
+    previous page, "<start_date ISO>_<id>", with an empty date for events
+    without a start date, which sort first. Returns (events, next_cursor);
+    raises ValueError for a malformed cursor.
+    """
+    # is_archived = 0 matches the partial indexes on (start_date) and (event_type, start_date);
+    # events that ended since the last archive run are filtered out on top
+    now = datetime.utcnow()
+    query = Event.query.filter(Event.is_archived == False,
+                               func.coalesce(Event.end_date, Event.start_date, now) >= now)
     
+    if event_type:
+        query = query.filter(Event.event_type == event_type)
+    if start:
+        query = query.filter(Event.start_date >= start)
+    if end:
+        query = query.filter(Event.start_date < end)
     if search:
         query = query.filter(Event.title.ilike(f'%{search}%') | Event.description.ilike(f'%{search}%'))
     if location:
         query = query.filter(Event.location.ilike(f'%{location}%'))
-    if event_type:
-        query = query.filter(Event.event_type == event_type)
     if is_internship:
         query = query.filter(Event.is_internship == True)
-        
-    events = query.order_by(Event.start_date.asc()).all()
+    
+    if after:
+        after_date, after_id = after.rsplit('_', 1)
+        after_date = datetime.fromisoformat(after_date) if after_date else None
+        after_id = int(after_id)
+        if after_date is None:
+            query = query.filter(
+                Event.start_date.isnot(None) |
+                (Event.start_date.is_(None) & (Event.id > after_id))
+            )
+        else:
+            query = query.filter(
+                (Event.start_date > after_date) |
+                ((Event.start_date == after_date) & (Event.id > after_id))
+            )
+    
+    # Undated events first on every database, matching the cursor filter above
+    events = query.order_by(Event.start_date.asc().nulls_first(), Event.id.asc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        last = events[-1]
+        next_cursor = f"{last.start_date.isoformat() if last.start_date else ''}_{last.id}"
+    
+    return events, next_cursor
+
+# Per-process cache of each user's registrations, dropped on (un)registration
+REGISTRATIONS_TTL = 300
+REGISTRATIONS_MAX_USERS = 10000
+_registrations = OrderedDict()
+_registrations_lock = threading.Lock()
+
+def user_registrations(user_id):
+    """{event_id: 'registered' or 'waitlisted'} for a user; treat as read-only"""
+    now = time.monotonic()
+    with _registrations_lock:
+        entry = _registrations.get(user_id)
+        if entry is not None and entry[0] > now:
+            _registrations.move_to_end(user_id)
+            return entry[1]
+    
+    registrations = dict(
+        db.session.query(EventRegistration.event_id, EventRegistration.status)
+        .filter(EventRegistration.user_id == user_id)
+    )
+    with _registrations_lock:
+        _registrations[user_id] = (now + REGISTRATIONS_TTL, registrations)
+        _registrations.move_to_end(user_id)
+        while len(_registrations) > REGISTRATIONS_MAX_USERS:
+            _registrations.popitem(last=False)
+    return registrations
+
+def forget_registrations(user_id):
+    with _registrations_lock:
+        _registrations.pop(user_id, None)
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+@events_bp.route('/')
+def index():
+    search = request.args.get('search', '')
+    location = request.args.get('location', '')
+    event_type = request.args.get('type', '')
+    is_internship = request.args.get('is_internship') == 'true'
+    start = request.args.get('start', '')
+    end = request.args.get('end', '')
+    after = request.args.get('after', '')
+    
+    # Defaults to everything that hasn't ended yet; the end date includes the whole day
+    end_date = _parse_date(end)
+    try:
+        events, next_cursor = paginate_events(
+            start=_parse_date(start),
+            end=end_date + timedelta(days=1) if end_date else None,
+            event_type=event_type,
+            search=search,
+            location=location,
+            is_internship=is_internship,
+            after=after
+        )
+    except ValueError:
+        abort(400)
     
     return render_template('events/index.html', 
                            events=events, 
                            search=search, 
                            location=location, 
                            event_type=event_type,
-                           is_internship=is_internship)
+                           is_internship=is_internship,
+                           start=start,
+                           end=end,
+                           next_cursor=next_cursor)
+
+@events_bp.cli.command('archive')
+def archive_command():
+    """Archive events that have already ended"""
+    archived = archive_past_events()
+    click.echo(f"Archived {archived} past events")
 
 @events_bp.route('/<int:event_id>')
 def detail(event_id):
     event = Event.query.get_or_404(event_id)
-    is_registered = False
+    status = None
     if current_user.is_authenticated:
-        is_registered = EventRegistration.query.filter_by(event_id=event_id, user_id=current_user.id).first() is not None
+        status = user_registrations(current_user.id).get(event_id)
         
-    return render_template('events/detail.html', event=event, is_registered=is_registered)
+    return render_template('events/detail.html', event=event,
+                           is_registered=status == 'registered', is_waitlisted=status == 'waitlisted')
 
 @events_bp.route('/<int:event_id>/register', methods=['POST'])
 @login_required
@@ -53,19 +196,168 @@ def register(event_id):
     existing = EventRegistration.query.filter_by(event_id=event_id, user_id=current_user.id).first()
     if existing:
         return jsonify({'success': False, 'message': 'Already registered for this event'})
+    
+    # Take a seat with a conditional increment, so concurrent requests can never overbook
+    seat = db.session.execute(
+        Event.__table__.update()
+        .where(Event.id == event_id, Event.capacity.is_(None) | (Event.registered_count < Event.capacity))
+        .values(registered_count=Event.registered_count + 1)
+    ).rowcount == 1
+    
+    if not seat and not event.waitlist_enabled:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'This event is full'})
         
     registration = EventRegistration(
         event_id=event_id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        status='registered' if seat else 'waitlisted'
     )
     db.session.add(registration)
+    bump_feed_version(my_events_feed(current_user.id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race against a concurrent request from the same user; also undoes the seat
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Already registered for this event'})
+    forget_registrations(current_user.id)
+    
+    if not seat:
+        return jsonify({'success': True, 'waitlisted': True,
+                        'message': 'This event is full, you have been added to the waitlist'})
+    return jsonify({'success': True, 'waitlisted': False, 'message': 'Successfully registered for the event'})
+
+@events_bp.route('/<int:event_id>/cancel', methods=['POST'])
+@login_required
+def cancel_registration(event_id):
+    registration = EventRegistration.query.filter_by(event_id=event_id, user_id=current_user.id).first()
+    if not registration:
+        return jsonify({'success': False, 'message': 'You are not registered for this event'})
+    
+    db.session.delete(registration)
+    # Flushing takes the write lock, so the seat hand-over below is serialised with other registrations
+    db.session.flush()
+    
+    promoted = None
+    if registration.status == 'registered':
+        # Hand the seat to the longest waiting user, or give it back
+        promoted = db.session.query(EventRegistration.id, EventRegistration.user_id)\
+            .filter_by(event_id=event_id, status='waitlisted')\
+            .order_by(EventRegistration.id)\
+            .first()
+        if promoted:
+            EventRegistration.query.filter_by(id=promoted.id, status='waitlisted')\
+                .update({'status': 'registered'}, synchronize_session=False)
+            bump_feed_version(my_events_feed(promoted.user_id))
+        else:
+            db.session.execute(
+                Event.__table__.update()
+                .where(Event.id == event_id, Event.registered_count > 0)
+                .values(registered_count=Event.registered_count - 1)
+            )
+    bump_feed_version(my_events_feed(current_user.id))
     db.session.commit()
     
-    return jsonify({'success': True, 'message': 'Successfully registered for the event'})
+    forget_registrations(current_user.id)
+    if promoted:
+        forget_registrations(promoted.user_id)
+    
+    return jsonify({'success': True, 'message': 'Your registration has been cancelled'})
 
 @events_bp.route('/my-events')
 @login_required
 def my_events():
-    registrations = EventRegistration.query.filter_by(user_id=current_user.id).all()
-    events = [r.event for r in registrations]
-    return render_template('events/my_events.html', events=events)
+    events = Event.query.join(EventRegistration, EventRegistration.event_id == Event.id)\
+        .filter(EventRegistration.user_id == current_user.id)\
+        .order_by(Event.start_date.asc())\
+        .all()
+    calendar_url = url_for('events_bp.my_calendar_feed', token=calendar_token(current_user), _external=True)
+    return render_template('events/my_events.html', events=events, now=datetime.utcnow(),
+                           calendar_url=calendar_url)
+
+# Columns written to the calendar feeds
+ICS_COLUMNS = (
+    Event.id, Event.title, Event.description, Event.location,
+    Event.start_date, Event.end_date, Event.created_at
+)
+
+def _ics_response(name, query, version, public):
+    """Stream a query of ICS_COLUMNS + status rows as an iCalendar feed"""
+    from modules.feeds import feed_response
+    from modules.ical import calendar_header, calendar_footer, format_event
+    
+    host = request.host.split(':')[0]
+    
+    def generate():
+        yield calendar_header(name)
+        for row in query.execution_options(stream_results=True).yield_per(FEED_BATCH_SIZE):
+            if row.start_date is None:
+                continue
+            url = url_for('events_bp.detail', event_id=row.id, _external=True)
+            yield format_event(row, url, host, status='TENTATIVE' if row.status == 'waitlisted' else 'CONFIRMED')
+        yield calendar_footer()
+    
+    response = feed_response(generate, 'text/calendar', version=version, public=public)
+    response.mimetype_params['charset'] = 'utf-8'
+    return response
+
+@events_bp.route('/calendar.ics')
+def calendar_feed():
+    """All upcoming events as an iCalendar feed"""
+    query = db.session.query(*ICS_COLUMNS, db.literal(None).label('status'))\
+        .filter(Event.is_archived == False)\
+        .order_by(Event.start_date.asc(), Event.id.asc())
+    return _ics_response('SkillMatch Events', query, feed_version(CALENDAR_FEED), public=True)
+
+def calendar_token(user):
+    """The secret in a user's calendar feed URL, created on first use"""
+    if not user.calendar_token:
+        user.calendar_token = secrets.token_urlsafe(32)
+        db.session.commit()
+    return user.calendar_token
+
+@events_bp.route('/my.ics')
+@login_required
+def my_calendar():
+    """Send a signed-in user to their calendar feed URL"""
+    return redirect(url_for('events_bp.my_calendar_feed', token=calendar_token(current_user)))
+
+@events_bp.route('/my.ics/reset', methods=['POST'])
+@login_required
+def reset_calendar_token():
+    """Replace the calendar feed URL, so the old one stops working"""
+    current_user.calendar_token = secrets.token_urlsafe(32)
+    db.session.commit()
+    return jsonify({
+        'success': True,
+        'url': url_for('events_bp.my_calendar_feed', token=current_user.calendar_token, _external=True)
+    })
+
+@events_bp.route('/calendar/<token>.ics')
+def my_calendar_feed(token):
+    """A user's registered and waitlisted events as an iCalendar feed.
+    
+    Calendar apps subscribe by URL without a session, so the user is
+    identified by the secret token in the path instead of a login.
+    """
+    user_id = db.session.query(User.id).filter(User.calendar_token == token).scalar()
+    if user_id is None:
+        abort(404)
+    query = db.session.query(*ICS_COLUMNS, EventRegistration.status)\
+        .join(EventRegistration, EventRegistration.event_id == Event.id)\
+        .filter(EventRegistration.user_id == user_id)\
+        .order_by(Event.start_date.asc(), Event.id.asc())
+    # Event edits change the user's feed too
+    version = feed_version(CALENDAR_FEED, my_events_feed(user_id))
+    return _ics_response('My SkillMatch Events', query, version, public=False)
+
+@events_bp.cli.command('dedupe-registrations')
+def dedupe_registrations_command():
+    """Delete duplicate event registrations, keeping the first, before creating the unique index"""
+    keep = db.session.query(func.min(EventRegistration.id))\
+        .group_by(EventRegistration.event_id, EventRegistration.user_id)
+    deleted = EventRegistration.query.filter(EventRegistration.id.not_in(keep))\
+        .delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Deleted {deleted} duplicate registrations")
@@ -0,0 +1,60 @@
+"""
+Feeds Module
+Change counters and the shared response helper for the streamed job, sitemap
+and calendar feeds. The counters also tell per-process caches when to reload.
+"""
+from flask import Response, request, stream_with_context
+from datetime import datetime
+import hashlib
+
+from extensions import db
+from models import FeedVersion
+from schema import increment
+
+def bump_feed_versions(names, connection=None):
+    """Record a change to each of the named feeds in the current transaction"""
+    now = datetime.utcnow()
+    increment(FeedVersion, ['name'], 'version',
+              [{'name': name, 'version': 1, 'updated_at': now} for name in names], connection)
+
+def bump_feed_version(name, connection=None):
+    """Record a change to a feed in the current transaction"""
+    bump_feed_versions([name], connection)
+
+def feed_version(*names):
+    """(etag, last_modified) of one or more feeds, read from FeedVersion only"""
+    rows = dict((name, (version, updated_at)) for name, version, updated_at in
+                db.session.query(FeedVersion.name, FeedVersion.version, FeedVersion.updated_at)
+                .filter(FeedVersion.name.in_(names)))
+    etag = hashlib.md5(';'.join(f"{name}:{rows.get(name, (0, None))[0]}" for name in names).encode()).hexdigest()
+    modified = [updated_at for _, updated_at in rows.values() if updated_at]
+    return etag, max(modified) if modified else None
+
+def feed_response(generate, mimetype, version, public=True):
+    """Stream a feed, answering conditional GETs with 304 before any rows are read.
+    
+    `version` is (etag, last_modified) of the feed's current contents.
+    """
+    etag, last_modified = version
+    
+    response = Response(status=200, mimetype=mimetype)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = 300
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = bool(last_modified and request.if_modified_since
+                            and last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None))
+    if not_modified:
+        response.status_code = 304
+        return response
+    
+    response.response = stream_with_context(generate())
+    return response
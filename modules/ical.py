@@ -0,0 +1,66 @@
+"""
+iCalendar Module
+Formats events as RFC 5545 calendar lines for the .ics feeds
+"""
+from datetime import datetime
+
+PRODID = '-//SkillMatch//AI Job Portal Events//EN'
+
+def escape(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')\
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+def format_time(value):
+    """Stored datetimes are UTC"""
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+def fold(line):
+    """Fold a content line at 75 octets, continuation lines start with a space"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Don't split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74
+    return '\r\n '.join(parts) + '\r\n'
+
+def calendar_header(name):
+    return ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape(name)}'
+    ))
+
+def calendar_footer():
+    return fold('END:VCALENDAR')
+
+def format_event(event, url, host, status='CONFIRMED', stamp=None):
+    """One VEVENT block for an Event or a row with the same attributes"""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event.id}@{host}',
+        f'DTSTAMP:{format_time(stamp or event.created_at or datetime.utcnow())}',
+        f'DTSTART:{format_time(event.start_date)}'
+    ]
+    if event.end_date:
+        lines.append(f'DTEND:{format_time(event.end_date)}')
+    lines.append(f'SUMMARY:{escape(event.title)}')
+    if event.description:
+        lines.append(f'DESCRIPTION:{escape(event.description)}')
+    lines.append(f'LOCATION:{escape(event.location or "Online")}')
+    lines.extend([
+        f'URL:{url}',
+        f'STATUS:{status}',
+        'END:VEVENT'
+    ])
+    return ''.join(fold(line) for line in lines)
@@ -0,0 +1,187 @@
+"""
+Job Import Module
+Streams CSV / JSONL job files row by row and inserts them in batches
+"""
+from datetime import datetime
+import csv
+import io
+import json
+
+from extensions import db
+from models import Job, JobLSHBucket, make_snippet
+from modules.dedup import job_fingerprint, decode_signature, band_buckets
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+JOB_TYPES = {'full-time', 'part-time', 'contract', 'remote', 'internship'}
+
+def normalize_skills(value):
+    """Turn a comma separated string or list into a clean, de-duplicated skill list"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+
+    skills = []
+    seen = set()
+    for skill in value:
+        skill = str(skill).strip()
+        if skill and skill.lower() not in seen:
+            seen.add(skill.lower())
+            skills.append(skill)
+    return skills
+
+def _to_int(value, field):
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"'{field}' must be a whole number")
+
+def _to_str(value, field):
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f"'{field}' must be text")
+    return value.strip()
+
+def iter_rows(stream, fmt):
+    """Yield (line_number, dict) pairs from a text stream without reading it all"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+def build_job_row(data, employer_id, default_company=None):
+    """Validate one input row and return the column values for a Job insert"""
+    if not isinstance(data, dict):
+        raise ValueError('Row is not a valid JSON object')
+
+    title = _to_str(data.get('title'), 'title')
+    description = _to_str(data.get('description'), 'description')
+    if not title:
+        raise ValueError("'title' is required")
+    if not description:
+        raise ValueError("'description' is required")
+
+    experience_min = _to_int(data.get('experience_min'), 'experience_min') or 0
+    experience_max = _to_int(data.get('experience_max'), 'experience_max')
+    salary_min = _to_int(data.get('salary_min'), 'salary_min')
+    salary_max = _to_int(data.get('salary_max'), 'salary_max')
+
+    if experience_max is not None and experience_max < experience_min:
+        raise ValueError("'experience_max' is lower than 'experience_min'")
+    if salary_min is not None and salary_max is not None and salary_max < salary_min:
+        raise ValueError("'salary_max' is lower than 'salary_min'")
+
+    job_type = (_to_str(data.get('job_type'), 'job_type') or 'full-time').lower()
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job_type '{job_type}'")
+
+    skills = data.get('skills', data.get('skills_required'))
+    if skills is not None and not isinstance(skills, (str, list)):
+        raise ValueError("'skills' must be text or a list")
+    requirements = _to_str(data.get('requirements'), 'requirements') or None
+    company = (_to_str(data.get('company'), 'company') or default_company or 'Company')[:100]
+
+    return {
+        'employer_id': employer_id,
+        'title': title[:150],
+        'company': company,
+        'description': description,
+        'description_snippet': make_snippet(description),
+        'minhash': job_fingerprint(title, company, description),
+        'requirements': requirements,
+        'skills_required': json.dumps(normalize_skills(skills)),
+        'experience_min': experience_min,
+        'experience_max': experience_max,
+        'salary_min': salary_min,
+        'salary_max': salary_max,
+        'location': _to_str(data.get('location'), 'location')[:100] or None,
+        'job_type': job_type,
+        'is_active': True,
+        'created_at': datetime.utcnow()
+    }
+
+def index_fingerprints(rows):
+    """Replace the stored LSH buckets of (job_id, fingerprint) rows, for duplicate lookups"""
+    rows = [(job_id, fingerprint) for job_id, fingerprint in rows]
+    if not rows:
+        return
+    JobLSHBucket.query.filter(JobLSHBucket.job_id.in_([job_id for job_id, _ in rows]))\
+        .delete(synchronize_session=False)
+    buckets = [{'job_id': job_id, 'bucket': bucket} for job_id, fingerprint in rows if fingerprint
+               for bucket in set(band_buckets(decode_signature(fingerprint)))]
+    if buckets:
+        db.session.execute(JobLSHBucket.__table__.insert(), buckets)
+
+def _flush(batch):
+    # A list of parameter dicts makes the driver use executemany()
+    job_ids = db.session.scalars(
+        Job.__table__.insert().returning(Job.id, sort_by_parameter_order=True), batch
+    ).all()
+    index_fingerprints(zip(job_ids, (row['minhash'] for row in batch)))
+    db.session.commit()
+
+def import_jobs(stream, fmt, employer_id, default_company=None, batch_size=BATCH_SIZE):
+    """Import jobs from a text stream, committing every batch_size rows.
+
+    Returns a summary with the number of imported rows and per-row errors.
+    """
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    for line_number, data in iter_rows(stream, fmt):
+        try:
+            batch.append(build_job_row(data, employer_id, default_company))
+        except ValueError as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'row': line_number, 'error': str(e)})
+            continue
+
+        if len(batch) >= batch_size:
+            _flush(batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        _flush(batch)
+        imported += len(batch)
+
+    return {
+        'imported': imported,
+        'failed': failed,
+        'errors': errors
+    }
+
+def detect_format(filename, fmt=None):
+    """Work out the import format from an explicit value or the file extension"""
+    if fmt:
+        return fmt.lower()
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+def import_jobs_from_file(file_storage, employer_id, default_company=None, fmt=None):
+    """Import from an uploaded werkzeug FileStorage without buffering it in memory"""
+    fmt = detect_format(file_storage.filename, fmt)
+    stream = io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+    return import_jobs(stream, fmt, employer_id, default_company)
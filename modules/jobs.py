@@ -1,13 +1,29 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, send_file, abort, flash
 from flask_login import login_required, current_user
+from sqlalchemy import func, case
+from sqlalchemy.orm import joinedload, load_only
 from datetime import datetime
+from xml.sax.saxutils import escape
+import click
+import hashlib
 import json
 import os
+import time
 
 from extensions import db
-from models import Job, Application, User, Resume, Skill
+from models import Job, JobLSHBucket, Application, User, Resume, Skill, SNIPPET_LENGTH
+from modules.job_import import normalize_skills, index_fingerprints
+from modules.dedup import job_fingerprint, decode_signature, band_buckets, build_index
+from modules.feeds import feed_response
 
-jobs_bp = Blueprint('jobs_bp', __name__, url_prefix='/jobs')
+jobs_bp = Blueprint('jobs_bp', __name__, url_prefix='/jobs', cli_group='jobs')
+
+# Columns needed to render a job card; leaves the large description and requirements unloaded
+JOB_CARD_COLUMNS = (
+    Job.id, Job.title, Job.company, Job.location, Job.job_type,
+    Job.experience_min, Job.experience_max, Job.salary_min, Job.salary_max,
+    Job.skills_required, Job.description_snippet, Job.created_at
+)
 
 def get_user_skills(user):
     """Get user skills as lowercase list"""
@@ -40,7 +56,7 @@ def jobs_list():
     experience = request.args.get('experience', '')
     
     # Build query
-    query = Job.query.filter_by(is_active=True)
+    query = Job.query.filter_by(is_active=True).options(load_only(*JOB_CARD_COLUMNS))
     
     if search:
         # Enhanced search - also search in skills
@@ -92,7 +108,7 @@ def search_jobs():
     search = request.args.get('q', '')
     location = request.args.get('location', '')
     
-    query = Job.query.filter_by(is_active=True)
+    query = Job.query.filter_by(is_active=True).options(load_only(*JOB_CARD_COLUMNS))
     
     if search:
         search_term = f'%{search}%'
@@ -129,7 +145,7 @@ def search_jobs():
             'experience_max': job.experience_max,
             'skills': skills[:5],
             'match_score': match_score,
-            'description_snippet': job.description[:150] + '...' if len(job.description or '') > 150 else job.description
+            'description_snippet': job.description_snippet
         })
     
     # Sort by match score if user is logged in
@@ -151,8 +167,11 @@ def get_recommendations():
     
     user_skills = get_user_skills(current_user)
     
-    # Get all active jobs
-    all_jobs = Job.query.filter_by(is_active=True).all()
+    # Get all active jobs, loading only the columns used for scoring
+    all_jobs = Job.query.filter_by(is_active=True).options(load_only(
+        Job.id, Job.title, Job.company, Job.location, Job.skills_required,
+        Job.experience_min, Job.salary_min, Job.salary_max
+    )).all()
     
     # Score each job
     scored_jobs = []
@@ -191,6 +210,155 @@ def get_recommendations():
         'user_skills': user_skills
     })
 
+@jobs_bp.cli.command('backfill-snippets')
+def backfill_snippets_command():
+    """Fill description_snippet for jobs created before the column existed"""
+    snippet = case(
+        (func.length(Job.description) > SNIPPET_LENGTH,
+         func.substr(Job.description, 1, SNIPPET_LENGTH) + '...'),
+        else_=Job.description
+    )
+    # Setting updated_at to itself skips its onupdate, so feed ETags and sitemap lastmod don't change
+    result = db.session.execute(
+        Job.__table__.update()
+        .where(Job.description_snippet.is_(None))
+        .values(description_snippet=snippet, updated_at=Job.updated_at)
+    )
+    db.session.commit()
+    click.echo(f"Filled {result.rowcount} snippets")
+
+@jobs_bp.cli.command('dedupe')
+@click.option('--employer-id', type=int, help='Only check this employer\'s jobs')
+@click.option('--threshold', type=float, help='Similarity threshold, defaults to DUPLICATE_JOB_THRESHOLD')
+@click.option('--dry-run', is_flag=True, help='Report duplicates without deactivating them')
+def dedupe_jobs_command(employer_id, threshold, dry_run):
+    """Find near-duplicate active jobs and deactivate the later reposts"""
+    from modules.dedup import LSHIndex, compute_signature, encode_signature, job_text
+    
+    if threshold is None:
+        threshold = current_app.config['DUPLICATE_JOB_THRESHOLD']
+    
+    employer_ids = [employer_id] if employer_id else \
+        [row[0] for row in db.session.query(Job.employer_id).filter(Job.is_active == True).distinct()]
+    
+    total = 0
+    for emp_id in employer_ids:
+        index = LSHIndex()
+        duplicates = []
+        jobs = db.session.query(Job.id, Job.title, Job.company, Job.description, Job.minhash)\
+                         .filter(Job.employer_id == emp_id, Job.is_active == True)\
+                         .order_by(Job.created_at, Job.id)
+        
+        # Oldest posting wins; later ones that match it are the reposts
+        backfill = []
+        for job_id, title, company, description, fingerprint in jobs:
+            if fingerprint:
+                signature = decode_signature(fingerprint)
+            else:
+                signature = compute_signature(job_text(title, company, description))
+                backfill.append({'id': job_id, 'minhash': encode_signature(signature)})
+            
+            matches = index.query(signature, threshold)
+            if matches:
+                duplicates.append({'id': job_id, 'duplicate_of': matches[0][0], 'is_active': False})
+                click.echo(f"Job {job_id} duplicates job {matches[0][0]} ({matches[0][1]:.0%} similar)")
+            else:
+                index.add(job_id, signature)
+        
+        if not dry_run:
+            if backfill:
+                db.session.bulk_update_mappings(Job, backfill)
+                index_fingerprints((row['id'], row['minhash']) for row in backfill)
+            if duplicates:
+                db.session.bulk_update_mappings(Job, duplicates)
+            db.session.commit()
+        total += len(duplicates)
+    
+    action = 'Found' if dry_run else 'Deactivated'
+    click.echo(f"{action} {total} duplicate jobs")
+
+@jobs_bp.cli.command('index-fingerprints')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+def index_fingerprints_command(batch_size):
+    """Rebuild the LSH buckets used to spot reposted jobs, e.g. after upgrading"""
+    indexed = 0
+    after = 0
+    while True:
+        rows = db.session.query(Job.id, Job.minhash)\
+            .filter(Job.id > after, Job.minhash.isnot(None))\
+            .order_by(Job.id).limit(batch_size).all()
+        if not rows:
+            break
+        index_fingerprints(rows)
+        db.session.commit()
+        indexed += len(rows)
+        after = rows[-1][0]
+    click.echo(f"Indexed {indexed} job fingerprints")
+
+FEED_BATCH_SIZE = 500
+
+def _feed_version():
+    """Return (etag, last_modified) for the active job feed from a single aggregate query"""
+    count, max_id, last_modified = db.session.query(
+        func.count(Job.id),
+        func.max(Job.id),
+        func.max(func.coalesce(Job.updated_at, Job.created_at))
+    ).filter(Job.is_active == True).one()
+    
+    if isinstance(last_modified, str):
+        last_modified = datetime.fromisoformat(last_modified)
+    etag = hashlib.md5(f"{count}:{max_id}:{last_modified}".encode()).hexdigest()
+    return etag, last_modified
+
+def _stream_active_jobs():
+    """Iterate active jobs in batches instead of loading the full result set"""
+    query = Job.query.filter_by(is_active=True)\
+                     .order_by(Job.id)\
+                     .execution_options(stream_results=True)\
+                     .yield_per(FEED_BATCH_SIZE)
+    for job in query:
+        yield job
+        db.session.expunge(job)
+
+@jobs_bp.route('/export.jsonl')
+def export_jobs():
+    """Stream all active jobs as JSON lines for partners"""
+    def generate():
+        for job in _stream_active_jobs():
+            yield json.dumps({
+                'id': job.id,
+                'title': job.title,
+                'company': job.company,
+                'description': job.description,
+                'skills': json.loads(job.skills_required) if job.skills_required else [],
+                'location': job.location,
+                'job_type': job.job_type,
+                'experience_min': job.experience_min,
+                'experience_max': job.experience_max,
+                'salary_min': job.salary_min,
+                'salary_max': job.salary_max,
+                'url': url_for('jobs_bp.job_detail', job_id=job.id, _external=True),
+                'created_at': job.created_at.isoformat() if job.created_at else None
+            }) + '\n'
+    
+    return feed_response(generate, 'application/x-ndjson', _feed_version())
+
+@jobs_bp.route('/sitemap.xml')
+def jobs_sitemap():
+    """Stream an XML sitemap of all active job pages"""
+    def generate():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        for job in _stream_active_jobs():
+            lastmod = job.updated_at or job.created_at
+            yield '<url><loc>{}</loc>{}</url>\n'.format(
+                escape(url_for('jobs_bp.job_detail', job_id=job.id, _external=True)),
+                f"<lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>" if lastmod else ''
+            )
+        yield '</urlset>\n'
+    
+    return feed_response(generate, 'application/xml', _feed_version())
+
 @jobs_bp.route('/<int:job_id>')
 def job_detail(job_id):
     job = Job.query.get_or_404(job_id)
@@ -236,7 +404,7 @@ def job_detail(job_id):
     similar_jobs = Job.query.filter(
         Job.id != job_id,
         Job.is_active == True
-    ).limit(4).all()
+    ).options(load_only(*JOB_CARD_COLUMNS)).limit(4).all()
     
     return render_template('jobs/detail.html', 
                          job=job, 
@@ -246,6 +414,29 @@ def job_detail(job_id):
                          similar_jobs=similar_jobs,
                          match_info=match_info)
 
+def find_duplicate_job(employer_id, fingerprint, threshold=None, exclude_id=None):
+    """Return (job_id, similarity) of the closest active near-duplicate posting, or None.
+    
+    Only jobs sharing an LSH bucket with the fingerprint are read, through the
+    JobLSHBucket index, so the cost doesn't grow with the employer's job count.
+    """
+    if threshold is None:
+        threshold = current_app.config['DUPLICATE_JOB_THRESHOLD']
+    
+    signature = decode_signature(fingerprint)
+    query = db.session.query(Job.id, Job.minhash)\
+        .join(JobLSHBucket, JobLSHBucket.job_id == Job.id)\
+        .filter(
+            JobLSHBucket.bucket.in_(band_buckets(signature)),
+            Job.employer_id == employer_id,
+            Job.is_active == True
+        ).distinct()
+    if exclude_id:
+        query = query.filter(Job.id != exclude_id)
+    
+    matches = build_index(query.all()).query(signature, threshold)
+    return matches[0] if matches else None
+
 @jobs_bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def create_job():
@@ -255,15 +446,13 @@ def create_job():
     if request.method == 'POST':
         data = request.get_json() if request.is_json else request.form
         
-        skills_list = data.get('skills', '').split(',') if isinstance(data.get('skills'), str) else data.get('skills', [])
-        
         job = Job(
             employer_id=current_user.id,
             title=data.get('title'),
             company=data.get('company') or current_user.company_name or 'Company',
             description=data.get('description'),
             requirements=data.get('requirements'),
-            skills_required=json.dumps([s.strip() for s in skills_list if s.strip()]),
+            skills_required=json.dumps(normalize_skills(data.get('skills'))),
             experience_min=int(data.get('experience_min', 0)) if data.get('experience_min') else 0,
             experience_max=int(data.get('experience_max', 0)) if data.get('experience_max') else None,
             salary_min=int(data.get('salary_min', 0)) if data.get('salary_min') else None,
@@ -271,21 +460,85 @@ def create_job():
             location=data.get('location'),
             job_type=data.get('job_type', 'full-time')
         )
+        job.minhash = job_fingerprint(job.title, job.company, job.description)
+        
+        # Check for a near-duplicate among this employer's active postings
+        duplicate = find_duplicate_job(current_user.id, job.minhash)
+        if duplicate:
+            job.duplicate_of = duplicate[0]
+            if current_app.config['DUPLICATE_JOB_ACTION'] == 'block' and not data.get('allow_duplicate'):
+                message = 'This job looks like a repost of one of your active jobs'
+                if not request.is_json:
+                    flash(message, 'warning')
+                    return render_template('jobs/create.html'), 409
+                return jsonify({
+                    'success': False,
+                    'message': message,
+                    'duplicate_of': duplicate[0],
+                    'similarity': duplicate[1]
+                })
         
         db.session.add(job)
+        db.session.flush()
+        index_fingerprints([(job.id, job.minhash)])
         db.session.commit()
         
         if request.is_json:
-            return jsonify({'success': True, 'job_id': job.id})
+            return jsonify({'success': True, 'job_id': job.id, 'duplicate_of': job.duplicate_of})
         return redirect(url_for('jobs_bp.job_detail', job_id=job.id))
     
     return render_template('jobs/create.html')
 
+@jobs_bp.route('/import', methods=['POST'])
+@login_required
+def import_jobs():
+    """Bulk import jobs from an uploaded CSV or JSONL file"""
+    from modules.job_import import import_jobs_from_file
+    
+    if current_user.role != 'employer':
+        return jsonify({'success': False, 'message': 'Only employers can import jobs'})
+    
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'success': False, 'message': 'No file uploaded'})
+    
+    try:
+        summary = import_jobs_from_file(file, current_user.id,
+                                        default_company=current_user.company_name,
+                                        fmt=request.form.get('format'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    
+    return jsonify({'success': True, **summary})
+
+@jobs_bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--employer-id', type=int, required=True, help='User ID of the employer posting the jobs')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+def import_jobs_command(path, employer_id, fmt, batch_size):
+    """Bulk import jobs from a CSV or JSONL file"""
+    from modules.job_import import import_jobs, detect_format
+    
+    employer = User.query.get(employer_id)
+    if not employer or employer.role != 'employer':
+        raise click.BadParameter('Not an employer account', param_hint='--employer-id')
+    
+    started = time.perf_counter()
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        summary = import_jobs(stream, detect_format(path, fmt), employer.id,
+                              default_company=employer.company_name, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    
+    for error in summary['errors']:
+        click.echo(f"Row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Imported {summary['imported']} jobs, {summary['failed']} failed in {elapsed:.2f}s")
+
 @jobs_bp.route('/<int:job_id>/apply', methods=['POST'])
 @login_required
 def apply_job(job_id):
     from modules.resume_ai import analyze_application
-    from modules.letter_generator import generate_letter
+    from modules.letter_cache import letter_url
     
     if current_user.role != 'seeker':
         return jsonify({'success': False, 'message': 'Only job seekers can apply'})
@@ -307,18 +560,20 @@ def apply_job(job_id):
         status=analysis['decision'],
         ai_score=analysis['overall_score'],
         match_percentage=analysis['match_percentage'],
+        ats_score=analysis.get('ats_score'),
         skills_match=json.dumps(analysis.get('matched_skills', [])),
         missing_skills=json.dumps(analysis.get('missing_skills', [])),
         feedback=json.dumps(analysis.get('feedback', {}))
     )
     
-    # Generate letter if decision is made
+    db.session.add(application)
+    
+    # Only the letter inputs are stored; the PDF is rendered on first download
     if analysis['decision'] in ['approved', 'rejected']:
-        letter_path = generate_letter(current_user, job, analysis)
-        application.letter_path = letter_path
+        db.session.flush()
+        application.letter_path = letter_url(application.id)
         application.decided_at = datetime.utcnow()
     
-    db.session.add(application)
     db.session.commit()
     
     return jsonify({
@@ -333,6 +588,26 @@ def apply_job(job_id):
         'letter_path': application.letter_path
     })
 
+@jobs_bp.route('/applications/<int:application_id>/letter')
+@login_required
+def download_letter(application_id):
+    """Serve an application's decision letter, rendering it on first download"""
+    from modules.letter_cache import get_letter
+    
+    application = Application.query.get_or_404(application_id)
+    job = Job.query.get(application.job_id)
+    
+    if current_user.id not in (application.user_id, job.employer_id):
+        abort(403)
+    if application.status not in ('approved', 'rejected'):
+        abort(404)
+    
+    letter, key = get_letter(application, User.query.get(application.user_id), job)
+    kind = 'offer_letter' if application.status == 'approved' else 'feedback_letter'
+    # conditional=True also answers Range requests for both cached files and in-memory buffers
+    return send_file(letter, mimetype='application/pdf', etag=key, conditional=True,
+                     download_name=f"{kind}_{application.id}.pdf")
+
 @jobs_bp.route('/<int:job_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_job(job_id):
@@ -356,6 +631,8 @@ def edit_job(job_id):
             skills = [s.strip() for s in data.get('skills').split(',')]
             job.skills_required = json.dumps(skills)
         
+        job.minhash = job_fingerprint(job.title, job.company, job.description)
+        index_fingerprints([(job.id, job.minhash)])
         db.session.commit()
         
         return redirect(url_for('jobs_bp.job_detail', job_id=job.id))
@@ -375,6 +652,86 @@ def toggle_job(job_id):
     
     return jsonify({'success': True, 'is_active': job.is_active})
 
+@jobs_bp.route('/<int:job_id>/close', methods=['POST'])
+@login_required
+def close_job(job_id):
+    """Close a job and send a decision letter to every remaining applicant.
+    
+    Letters are rendered when first downloaded; `flask jobs render-letters`
+    pre-renders them for a large job across a process pool.
+    """
+    from modules.letter_batch import decide_job_letters
+    
+    job = Job.query.get_or_404(job_id)
+    
+    if job.employer_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    job.is_active = False
+    _, decided = decide_job_letters(job_id)
+    db.session.commit()
+    
+    return jsonify({'success': True, 'decided': len(decided)})
+
+@jobs_bp.cli.command('render-letters')
+@click.argument('job_id', type=int)
+@click.option('--workers', type=int, help='Worker processes, defaults to the CPU count')
+def render_letters_command(job_id, workers):
+    """Render decision letters for all remaining applicants of a job"""
+    from modules.letter_batch import render_job_letters
+    
+    try:
+        summary = render_job_letters(job_id, workers=workers)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    click.echo(f"Rendered {summary['rendered']} letters ({summary['skipped']} already existed) "
+               f"in {summary['seconds']}s, {summary['letters_per_second']} letters/s")
+
+APPLICATIONS_PER_PAGE = 20
+
+def paginate_applications(job_id, status=None, min_score=None, max_score=None, after=None, limit=APPLICATIONS_PER_PAGE):
+    """Keyset-paginate a job's applications by (ai_score, id) descending.
+    
+    Applications that haven't been scored yet come last. `after` is the cursor
+    returned for the previous page, "<score>:<id>", with an empty score for
+    unscored applications. Returns (applications, next_cursor); raises
+    ValueError for a malformed cursor.
+    """
+    query = Application.query.filter(Application.job_id == job_id)\
+        .options(joinedload(Application.applicant).load_only(User.id, User.name, User.headline, User.profile_image))
+    
+    if status:
+        query = query.filter(Application.status == status)
+    if min_score is not None:
+        query = query.filter(Application.ai_score >= min_score)
+    if max_score is not None:
+        query = query.filter(Application.ai_score <= max_score)
+    
+    if after:
+        after_score, after_id = after.split(':')
+        after_score, after_id = int(after_score) if after_score else None, int(after_id)
+        if after_score is None:
+            query = query.filter(Application.ai_score.is_(None), Application.id < after_id)
+        else:
+            query = query.filter(
+                (Application.ai_score < after_score) |
+                ((Application.ai_score == after_score) & (Application.id < after_id)) |
+                Application.ai_score.is_(None)
+            )
+    
+    # Unscored applications last on every database, matching the cursor filter above
+    applications = query.order_by(Application.ai_score.desc().nulls_last(), Application.id.desc())\
+        .limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(applications) > limit:
+        applications = applications[:limit]
+        last = applications[-1]
+        next_cursor = f"{'' if last.ai_score is None else last.ai_score}:{last.id}"
+    
+    return applications, next_cursor
+
 @jobs_bp.route('/<int:job_id>/applications')
 @login_required
 def job_applications(job_id):
@@ -383,6 +740,42 @@ def job_applications(job_id):
     if job.employer_id != current_user.id:
         return redirect(url_for('jobs_bp.jobs_list'))
     
-    applications = Application.query.filter_by(job_id=job_id).order_by(Application.ai_score.desc()).all()
+    status = request.args.get('status', '')
+    min_score = request.args.get('min_score', type=int)
+    max_score = request.args.get('max_score', type=int)
+    after = request.args.get('after', '')
+    
+    try:
+        applications, next_cursor = paginate_applications(job_id, status=status, min_score=min_score,
+                                                          max_score=max_score, after=after)
+    except ValueError:
+        if request.args.get('format') == 'json':
+            return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+        abort(400)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'applications': [{
+                'id': app.id,
+                'status': app.status,
+                'ai_score': app.ai_score,
+                'match_percentage': app.match_percentage,
+                'applied_at': app.applied_at.isoformat() if app.applied_at else None,
+                'applicant': {
+                    'id': app.applicant.id,
+                    'name': app.applicant.name,
+                    'headline': app.applicant.headline,
+                    'profile_image': app.applicant.profile_image
+                }
+            } for app in applications],
+            'next_cursor': next_cursor
+        })
     
-    return render_template('jobs/applications.html', job=job, applications=applications)
+    return render_template('jobs/applications.html',
+                           job=job,
+                           applications=applications,
+                           next_cursor=next_cursor,
+                           status=status,
+                           min_score=min_score,
+                           max_score=max_score)
@@ -0,0 +1,95 @@
+"""
+Letter Batch Module
+Renders decision letters for every remaining applicant of a job across a process pool
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from flask import current_app
+import os
+import time
+
+from extensions import db
+from models import Job, Application, User
+from modules.letter_cache import letter_inputs, letter_url, cache_key, cache_dir, cache_path, render_to_cache, evict
+from modules.letter_generator import warm_up
+
+# Statuses that still need a decision when a job is closed
+OPEN_STATUSES = ('pending', 'under_review')
+
+def _render(task):
+    application_id, path, user, job, analysis, issued_at = task
+    render_to_cache(path, user, job, analysis, issued_at)
+    return application_id
+
+def decide_job_letters(job_id):
+    """Reject the open applications of a closed job and point every decided one at its letter.
+
+    Letters aren't rendered here; they're rendered on first download, or ahead
+    of time by render_job_letters(). The caller commits.
+    Returns (job, [(application, user)] of the decided applications).
+    """
+    job = Job.query.get(job_id)
+    if job is None:
+        raise ValueError(f"Job {job_id} not found")
+
+    rows = db.session.query(Application, User)\
+        .join(User, Application.user_id == User.id)\
+        .filter(Application.job_id == job_id)\
+        .all()
+
+    now = datetime.utcnow()
+    decided = []
+    for application, user in rows:
+        if application.status in OPEN_STATUSES:
+            application.status = 'rejected'
+            application.decided_at = now
+        elif application.status not in ('approved', 'rejected'):
+            continue
+        decided.append((application, user))
+
+    db.session.bulk_update_mappings(Application, [
+        {'id': application.id, 'letter_path': letter_url(application.id)} for application, _ in decided
+    ])
+    return job, decided
+
+def render_job_letters(job_id, workers=None):
+    """Decide and render letters for all applicants of a job that don't have one yet.
+
+    Open applications are rejected, since the job is closed. Letters are
+    rendered into the content-addressed letter cache, so letters that are
+    already cached are skipped and re-running is safe. Without
+    PERSIST_LETTERS only the decisions are recorded.
+    Returns a summary with counts and throughput.
+    """
+    job, decided = decide_job_letters(job_id)
+
+    tasks = []
+    skipped = 0
+    # Without PERSIST_LETTERS letters are rendered in memory on download, nothing to pre-render
+    if current_app.config['PERSIST_LETTERS']:
+        directory = cache_dir()
+        for application, user in decided:
+            user_data, job_data, analysis, issued_at = letter_inputs(application, user, job)
+            path = cache_path(directory, cache_key(user_data, job_data, analysis, issued_at))
+            if os.path.exists(path):
+                skipped += 1
+                continue
+            tasks.append((application.id, path, user_data, job_data, analysis, issued_at))
+    db.session.commit()
+
+    started = time.perf_counter()
+    rendered = 0
+    if tasks:
+        chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as pool:
+            for _ in pool.map(_render, tasks, chunksize=chunksize):
+                rendered += 1
+        evict()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'rendered': rendered,
+        'skipped': skipped,
+        'seconds': round(elapsed, 2),
+        'letters_per_second': round(rendered / elapsed, 1) if elapsed else 0
+    }
@@ -0,0 +1,136 @@
+"""
+Letter Cache Module
+Renders decision letters on first download and keeps them in a
+content-addressed, size-bounded disk cache
+"""
+from flask import current_app
+from types import SimpleNamespace
+import hashlib
+import json
+import os
+import tempfile
+
+from modules.letter_generator import generate_letter, render_letter_pdf
+
+def letter_url(application_id):
+    """Download URL stored in Application.letter_path"""
+    return f"/jobs/applications/{application_id}/letter"
+
+def _load_json(value, default):
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        return default
+
+def letter_inputs(application, user, job):
+    """Plain, picklable letter inputs rebuilt from a stored Application"""
+    analysis = {
+        'decision': application.status,
+        'overall_score': application.ai_score or 0,
+        'match_percentage': application.match_percentage or 0,
+        'matched_skills': _load_json(application.skills_match, []),
+        'missing_skills': _load_json(application.missing_skills, []),
+        'feedback': _load_json(application.feedback, {})
+    }
+    if application.ats_score is not None:
+        analysis['ats_score'] = application.ats_score
+
+    return (
+        SimpleNamespace(id=user.id, name=user.name),
+        SimpleNamespace(id=job.id, title=job.title, company=job.company, location=job.location,
+                        job_type=job.job_type, salary_min=job.salary_min, salary_max=job.salary_max),
+        analysis,
+        application.decided_at or application.applied_at
+    )
+
+def cache_key(user, job, analysis, issued_at):
+    """Hash of everything that appears in the letter"""
+    payload = {
+        'user': vars(user),
+        'job': vars(job),
+        'analysis': analysis,
+        'issued_at': issued_at.strftime('%Y%m%d_%H%M%S') if issued_at else None
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def cache_dir():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'letters', 'cache')
+
+def cache_path(directory, key):
+    # Sharded by the first byte of the key to keep directories small
+    return os.path.join(directory, key[:2], f"{key}.pdf")
+
+def render_to_cache(path, user, job, analysis, issued_at):
+    """Render a letter into the cache unless it is already there. Safe to call from worker processes."""
+    if os.path.exists(path):
+        return False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Render to a temp file and rename so readers never see a half-written PDF
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        generate_letter(user, job, analysis, output=tmp_path, issued_at=issued_at)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+def get_letter(application, user, job):
+    """Return (path or in-memory buffer, key) of the letter for an application.
+
+    With PERSIST_LETTERS the letter is served from the disk cache and
+    rendered into it on a miss; otherwise it is rendered into memory.
+    """
+    user_data, job_data, analysis, issued_at = letter_inputs(application, user, job)
+    key = cache_key(user_data, job_data, analysis, issued_at)
+    
+    if not current_app.config['PERSIST_LETTERS']:
+        return render_letter_pdf(user_data, job_data, analysis, issued_at), key
+    
+    path = cache_path(cache_dir(), key)
+
+    if render_to_cache(path, user_data, job_data, analysis, issued_at):
+        evict()
+    else:
+        # Touch on hit so eviction drops the least recently used letters first
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            render_to_cache(path, user_data, job_data, analysis, issued_at)
+    return path, key
+
+def evict(max_bytes=None):
+    """Delete least recently used letters until the cache fits in LETTER_CACHE_MAX_BYTES"""
+    if max_bytes is None:
+        max_bytes = current_app.config['LETTER_CACHE_MAX_BYTES']
+
+    directory = cache_dir()
+    if not os.path.isdir(directory):
+        return 0
+
+    entries = []
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.pdf'):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+    removed = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+    return removed
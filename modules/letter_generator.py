@@ -6,122 +6,317 @@ from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, HRFlowable
+from reportlab.platypus import (BaseDocTemplate, PageTemplate, Frame,
+                                Paragraph, Spacer, Table, TableStyle, HRFlowable)
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+from reportlab.pdfbase import pdfmetrics
 from datetime import datetime
+from io import BytesIO
+from types import MappingProxyType
+import copy
 import os
+import threading
 
-def generate_letter(user, job, analysis):
+from config import Config
+from modules.storage import relative_path, public_url
+
+def generate_letter(user, job, analysis, output=None, issued_at=None):
     """Generate appropriate letter based on application decision"""
     if analysis['decision'] == 'approved':
-        return generate_offer_letter(user, job, analysis)
+        return generate_offer_letter(user, job, analysis, output, issued_at)
     elif analysis['decision'] == 'rejected':
-        return generate_rejection_letter(user, job, analysis)
+        return generate_rejection_letter(user, job, analysis, output, issued_at)
     return None
 
-def get_styles():
-    """Get custom paragraph styles"""
+def render_letter_pdf(user, job, analysis, issued_at=None):
+    """Render a decision letter into memory and return the buffer, rewound for reading"""
+    buffer = BytesIO()
+    if generate_letter(user, job, analysis, output=buffer, issued_at=issued_at) is None:
+        return None
+    buffer.seek(0)
+    return buffer
+
+def _build_styles():
+    """Build the custom paragraph styles on top of the ReportLab sample sheet"""
     styles = getSampleStyleSheet()
     
-    # Only add styles if they don't already exist
-    if 'CustomTitle' not in styles.byName:
-        styles.add(ParagraphStyle(
-            name='CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#0a66c2')
-        ))
-    
-    if 'CompanyName' not in styles.byName:
-        styles.add(ParagraphStyle(
-            name='CompanyName',
-            parent=styles['Normal'],
-            fontSize=18,
-            spaceAfter=5,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#1a1a1a'),
-            fontName='Helvetica-Bold'
-        ))
-    
-    if 'SubTitle' not in styles.byName:
-        styles.add(ParagraphStyle(
-            name='SubTitle',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=20,
-            alignment=TA_CENTER,
-            textColor=colors.grey
-        ))
-    
-    if 'CustomBody' not in styles.byName:
-        styles.add(ParagraphStyle(
-            name='CustomBody',
-            parent=styles['Normal'],
-            fontSize=11,
-            spaceAfter=12,
-            alignment=TA_JUSTIFY,
-            leading=16
-        ))
-    
-    if 'SectionHeader' not in styles.byName:
-        styles.add(ParagraphStyle(
-            name='SectionHeader',
-            parent=styles['Heading2'],
-            fontSize=14,
-            spaceBefore=20,
-            spaceAfter=10,
-            textColor=colors.HexColor('#0a66c2')
-        ))
-    
-    if 'ListItem' not in styles.byName:
-        styles.add(ParagraphStyle(
-            name='ListItem',
-            parent=styles['Normal'],
-            fontSize=11,
-            leftIndent=20,
-            spaceAfter=8,
-            bulletIndent=10
-        ))
-    
-    if 'Footer' not in styles.byName:
-        styles.add(ParagraphStyle(
-            name='Footer',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.grey,
-            alignment=TA_CENTER
-        ))
-    
-    return styles
+    styles.add(ParagraphStyle(
+        name='CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        textColor=colors.HexColor('#0a66c2')
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='CompanyName',
+        parent=styles['Normal'],
+        fontSize=18,
+        spaceAfter=5,
+        alignment=TA_CENTER,
+        textColor=colors.HexColor('#1a1a1a'),
+        fontName='Helvetica-Bold'
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='SubTitle',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=20,
+        alignment=TA_CENTER,
+        textColor=colors.grey
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='CustomBody',
+        parent=styles['Normal'],
+        fontSize=11,
+        spaceAfter=12,
+        alignment=TA_JUSTIFY,
+        leading=16
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='SectionHeader',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceBefore=20,
+        spaceAfter=10,
+        textColor=colors.HexColor('#0a66c2')
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='ListItem',
+        parent=styles['Normal'],
+        fontSize=11,
+        leftIndent=20,
+        spaceAfter=8,
+        bulletIndent=10
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='Footer',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=colors.grey,
+        alignment=TA_CENTER
+    ))
+    
+    # Read-only view so no caller can change the shared styles
+    return MappingProxyType(dict(styles.byName))
+
+# Built once per process and shared by every letter
+STYLES = _build_styles()
+
+POSITION_TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONT', (1, 0), (1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 11),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#0a66c2')),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
+    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e0e0e0')),
+])
+
+ANALYSIS_TABLE_STYLE = TableStyle([
+    ('FONT', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 11),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#fff3f3')),
+    ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#ffcccc')),
+])
+
+class StaticParagraph(Paragraph):
+    """Paragraph whose text never changes: parsed once and line-broken once per width.
+    
+    Line breaks are kept per thread, so documents rendered on different
+    threads never share the same layout objects.
+    """
+    
+    def __init__(self, text, style):
+        Paragraph.__init__(self, text, style)
+        self._local = threading.local()
+    
+    def wrap(self, availWidth, availHeight):
+        layouts = getattr(self._local, 'layouts', None)
+        if layouts is None:
+            layouts = self._local.layouts = {}
+        layout = layouts.get(availWidth)
+        if layout is None:
+            Paragraph.wrap(self, availWidth, availHeight)
+            layouts[availWidth] = (self._wrapWidths, self.blPara, self.height)
+        else:
+            self.width = availWidth
+            self._wrapWidths, self.blPara, self.height = layout
+        return self.width, self.height
+
+# Content stream of each footer form, by (kind, internal font name), recorded
+# from the first document and replayed into the form of every later one
+_FOOTER_CODE = {}
+
+class LetterDocTemplate(BaseDocTemplate):
+    """Letter page whose footer chrome is a form XObject drawn on every page.
+    
+    Only the reference line is placed per page. A PDF can't point at another
+    file's objects, so each document gets its own form, but its drawing
+    operations are recorded once per process and copied in.
+    """
+    
+    def __init__(self, output, kind, reference):
+        BaseDocTemplate.__init__(self, output, pagesize=letter,
+                                 rightMargin=72, leftMargin=72,
+                                 topMargin=72, bottomMargin=72)
+        self.kind = kind
+        self.reference = reference
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='body')
+        self.addPageTemplates([PageTemplate(id='letter', frames=[frame], onPage=self._draw_page)])
+    
+    def _draw_page(self, canv, doc):
+        form_name = f"{self.kind}_footer"
+        if not canv.hasForm(form_name):
+            # The recorded operations name the font by its internal name in this document
+            key = (self.kind, canv._doc.getInternalFontName('Helvetica'))
+            code = _FOOTER_CODE.get(key)
+            canv.beginForm(form_name)
+            if code is None:
+                canv.setStrokeColor(colors.grey)
+                canv.setLineWidth(1)
+                canv.line(self.leftMargin, 54, self.pagesize[0] - self.rightMargin, 54)
+                canv.setFillColor(colors.grey)
+                canv.setFont('Helvetica', 9)
+                canv.drawCentredString(self.pagesize[0] / 2, 40,
+                                       f"This {self.kind} letter was automatically generated by SkillMatch AI Job Portal.")
+                _FOOTER_CODE[key] = list(canv._code)
+            else:
+                canv._code.extend(code)
+            canv.endForm()
+        
+        canv.saveState()
+        canv.doForm(form_name)
+        canv.setFillColor(colors.grey)
+        canv.setFont('Helvetica', 9)
+        canv.drawCentredString(self.pagesize[0] / 2, 28, f"Reference: {self.reference}")
+        canv.restoreState()
+
+_templates = threading.local()
+
+def _template(kind, reference):
+    """The calling thread's document template for a kind of letter, built once per thread.
+    
+    BaseDocTemplate keeps its build state on itself, so threads don't share one.
+    """
+    templates = getattr(_templates, 'by_kind', None)
+    if templates is None:
+        templates = _templates.by_kind = {}
+    doc = templates.get(kind)
+    if doc is None:
+        doc = templates[kind] = LetterDocTemplate(None, kind, reference)
+    doc.reference = reference
+    return doc
+
+def _fresh(flowables):
+    """Shallow copies of shared static flowables for one document.
+    
+    Layout keeps per-document state (e.g. _postponed) on the flowable
+    itself, while the copies still share the parsed text and line breaks.
+    """
+    return [copy.copy(f) for f in flowables]
+
+# Static parts of each letter, built once and shared by every document
+OFFER_HEADER = [
+    StaticParagraph("OFFER LETTER", STYLES['CustomTitle']),
+    HRFlowable(width="100%", thickness=2, color=colors.HexColor('#0a66c2')),
+    Spacer(1, 20),
+]
+
+OFFER_CLOSING = [
+    StaticParagraph("Next Steps", STYLES['SectionHeader']),
+    StaticParagraph("• Our HR team will contact you within 3-5 business days", STYLES['ListItem']),
+    StaticParagraph("• You will receive further documentation for onboarding", STYLES['ListItem']),
+    StaticParagraph("• Please respond to confirm your acceptance", STYLES['ListItem']),
+    Spacer(1, 20),
+    StaticParagraph(
+        "We are excited about the prospect of you joining our team and look forward to your positive response.",
+        STYLES['CustomBody']
+    ),
+    Spacer(1, 30),
+    StaticParagraph("Best Regards,", STYLES['CustomBody']),
+]
+
+REJECTION_HEADER = [
+    StaticParagraph("APPLICATION FEEDBACK", STYLES['CustomTitle']),
+    HRFlowable(width="100%", thickness=2, color=colors.HexColor('#666666')),
+    Spacer(1, 20),
+]
+
+REJECTION_NOTE = StaticParagraph(
+    "Please note that this decision does not reflect on your overall abilities or potential. "
+    "Below, we provide detailed feedback to help you improve your chances in future applications.",
+    STYLES['CustomBody']
+)
+
+REJECTION_CLOSING = [
+    StaticParagraph("Moving Forward", STYLES['SectionHeader']),
+    StaticParagraph(
+        "We encourage you to continue developing your skills and to reapply for future openings "
+        "that match your profile. Our job portal is continuously updated with new opportunities.",
+        STYLES['CustomBody']
+    ),
+    StaticParagraph("Tips to improve your candidacy:", STYLES['CustomBody']),
+    StaticParagraph("• Update your resume with relevant keywords and quantified achievements", STYLES['ListItem']),
+    StaticParagraph("• Complete online courses for skills you're missing", STYLES['ListItem']),
+    StaticParagraph("• Ensure your resume is ATS-friendly with clear formatting", STYLES['ListItem']),
+    StaticParagraph("• Build projects that showcase your technical abilities", STYLES['ListItem']),
+    Spacer(1, 20),
+    StaticParagraph("We wish you all the best in your job search and future career endeavors.", STYLES['CustomBody']),
+    Spacer(1, 30),
+    StaticParagraph("Best Regards,", STYLES['CustomBody']),
+]
+
+def get_styles():
+    """Get custom paragraph styles"""
+    return STYLES
+
+def warm_up():
+    """Load fonts and layout caches so the first letter in a worker isn't slower"""
+    for font_name in ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Times-Roman'):
+        pdfmetrics.getFont(font_name)
+    
+    buffer = BytesIO()
+    doc = _template('offer', 'WARM-UP')
+    doc.build(_fresh(OFFER_HEADER + OFFER_CLOSING + REJECTION_HEADER + [REJECTION_NOTE] + REJECTION_CLOSING) + [
+        Paragraph("<b>Warm-up</b>", STYLES['CustomBody']),
+        Table([['Warm-up:', 'Warm-up']], style=POSITION_TABLE_STYLE),
+    ], filename=buffer)
 
-def generate_offer_letter(user, job, analysis):
+def generate_offer_letter(user, job, analysis, output=None, issued_at=None):
     """Generate a professional offer letter PDF"""
-    # Create filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    # Letters rendered for a stored decision are dated by it so they can be re-created exactly
+    issued_at = issued_at or datetime.now()
+    timestamp = issued_at.strftime('%Y%m%d_%H%M%S')
     filename = f"offer_letter_{user.id}_{job.id}_{timestamp}.pdf"
-    file_path = os.path.join('static', 'uploads', 'letters', filename)
+    relative = relative_path('letters', filename)
+    file_path = output if output is not None else os.path.join(Config.UPLOAD_FOLDER, *relative.split('/'))
     
     # Ensure directory exists
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if output is None:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
     # Create PDF
-    doc = SimpleDocTemplate(file_path, pagesize=letter, 
-                           rightMargin=72, leftMargin=72,
-                           topMargin=72, bottomMargin=72)
+    doc = _template('offer', f"APP-{user.id}-{job.id}-{timestamp}")
     
-    styles = get_styles()
+    styles = STYLES
     story = []
     
     # Header
     story.append(Paragraph(job.company or "Company", styles['CompanyName']))
-    story.append(Paragraph("OFFER LETTER", styles['CustomTitle']))
-    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#0a66c2')))
-    story.append(Spacer(1, 20))
+    story.extend(_fresh(OFFER_HEADER))
     
     # Date
-    story.append(Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", styles['CustomBody']))
+    story.append(Paragraph(f"Date: {issued_at.strftime('%B %d, %Y')}", styles['CustomBody']))
     story.append(Spacer(1, 10))
     
     # Recipient
@@ -161,16 +356,7 @@ def generate_offer_letter(user, job, analysis):
         position_data.append(['Salary:', salary])
     
     position_table = Table(position_data, colWidths=[120, 350])
-    position_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONT', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#0a66c2')),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
-        ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#e0e0e0')),
-    ]))
+    position_table.setStyle(POSITION_TABLE_STYLE)
     story.append(position_table)
     story.append(Spacer(1, 15))
     
@@ -181,64 +367,41 @@ def generate_offer_letter(user, job, analysis):
         story.append(Paragraph(f"<b>{skills_text}</b>", styles['CustomBody']))
         story.append(Spacer(1, 10))
     
-    # Next Steps
-    story.append(Paragraph("Next Steps", styles['SectionHeader']))
-    story.append(Paragraph("• Our HR team will contact you within 3-5 business days", styles['ListItem']))
-    story.append(Paragraph("• You will receive further documentation for onboarding", styles['ListItem']))
-    story.append(Paragraph("• Please respond to confirm your acceptance", styles['ListItem']))
-    
-    story.append(Spacer(1, 20))
-    
-    # Closing
-    story.append(Paragraph(
-        "We are excited about the prospect of you joining our team and look forward to your positive response.",
-        styles['CustomBody']
-    ))
-    
-    story.append(Spacer(1, 30))
-    story.append(Paragraph("Best Regards,", styles['CustomBody']))
+    # Next Steps and closing
+    story.extend(_fresh(OFFER_CLOSING))
     story.append(Paragraph(f"<b>HR Team</b><br/>{job.company}", styles['CustomBody']))
     
-    # Footer
-    story.append(Spacer(1, 40))
-    story.append(HRFlowable(width="100%", thickness=1, color=colors.grey))
-    story.append(Spacer(1, 10))
-    story.append(Paragraph(
-        "This offer letter was automatically generated by SkillMatch AI Job Portal. "
-        f"Reference: APP-{user.id}-{job.id}-{timestamp}",
-        styles['Footer']
-    ))
-    
-    doc.build(story)
+    doc.build(story, filename=file_path)
     
-    return f"/static/uploads/letters/{filename}"
+    if output is not None:
+        return output
+    return public_url(relative)
 
-def generate_rejection_letter(user, job, analysis):
+def generate_rejection_letter(user, job, analysis, output=None, issued_at=None):
     """Generate a rejection letter with detailed feedback"""
     # Create filename
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    issued_at = issued_at or datetime.now()
+    timestamp = issued_at.strftime('%Y%m%d_%H%M%S')
     filename = f"feedback_letter_{user.id}_{job.id}_{timestamp}.pdf"
-    file_path = os.path.join('static', 'uploads', 'letters', filename)
+    relative = relative_path('letters', filename)
+    file_path = output if output is not None else os.path.join(Config.UPLOAD_FOLDER, *relative.split('/'))
     
     # Ensure directory exists
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if output is None:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
     
     # Create PDF
-    doc = SimpleDocTemplate(file_path, pagesize=letter,
-                           rightMargin=72, leftMargin=72,
-                           topMargin=72, bottomMargin=72)
+    doc = _template('feedback', f"FEEDBACK-{user.id}-{job.id}-{timestamp}")
     
-    styles = get_styles()
+    styles = STYLES
     story = []
     
     # Header
     story.append(Paragraph(job.company or "Company", styles['CompanyName']))
-    story.append(Paragraph("APPLICATION FEEDBACK", styles['CustomTitle']))
-    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#666666')))
-    story.append(Spacer(1, 20))
+    story.extend(_fresh(REJECTION_HEADER))
     
     # Date
-    story.append(Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", styles['CustomBody']))
+    story.append(Paragraph(f"Date: {issued_at.strftime('%B %d, %Y')}", styles['CustomBody']))
     story.append(Spacer(1, 10))
     
     # Recipient
@@ -261,11 +424,7 @@ def generate_rejection_letter(user, job, analysis):
         styles['CustomBody']
     ))
     
-    story.append(Paragraph(
-        "Please note that this decision does not reflect on your overall abilities or potential. "
-        "Below, we provide detailed feedback to help you improve your chances in future applications.",
-        styles['CustomBody']
-    ))
+    story.extend(_fresh([REJECTION_NOTE]))
     
     # Analysis Summary
     story.append(Paragraph("Your Application Analysis", styles['SectionHeader']))
@@ -277,14 +436,7 @@ def generate_rejection_letter(user, job, analysis):
     ]
     
     analysis_table = Table(analysis_data, colWidths=[150, 100])
-    analysis_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#fff3f3')),
-        ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#ffcccc')),
-    ]))
+    analysis_table.setStyle(ANALYSIS_TABLE_STYLE)
     story.append(analysis_table)
     story.append(Spacer(1, 15))
     
@@ -316,45 +468,12 @@ def generate_rejection_letter(user, job, analysis):
             story.append(Paragraph(f"→ {rec}", styles['ListItem']))
         story.append(Spacer(1, 10))
     
-    # Encouragement
-    story.append(Paragraph("Moving Forward", styles['SectionHeader']))
-    story.append(Paragraph(
-        "We encourage you to continue developing your skills and to reapply for future openings "
-        "that match your profile. Our job portal is continuously updated with new opportunities.",
-        styles['CustomBody']
-    ))
-    
-    story.append(Paragraph(
-        "Tips to improve your candidacy:",
-        styles['CustomBody']
-    ))
-    story.append(Paragraph("• Update your resume with relevant keywords and quantified achievements", styles['ListItem']))
-    story.append(Paragraph("• Complete online courses for skills you're missing", styles['ListItem']))
-    story.append(Paragraph("• Ensure your resume is ATS-friendly with clear formatting", styles['ListItem']))
-    story.append(Paragraph("• Build projects that showcase your technical abilities", styles['ListItem']))
-    
-    story.append(Spacer(1, 20))
-    
-    # Closing
-    story.append(Paragraph(
-        "We wish you all the best in your job search and future career endeavors.",
-        styles['CustomBody']
-    ))
-    
-    story.append(Spacer(1, 30))
-    story.append(Paragraph("Best Regards,", styles['CustomBody']))
+    # Encouragement and closing
+    story.extend(_fresh(REJECTION_CLOSING))
     story.append(Paragraph(f"<b>HR Team</b><br/>{job.company}", styles['CustomBody']))
     
-    # Footer
-    story.append(Spacer(1, 40))
-    story.append(HRFlowable(width="100%", thickness=1, color=colors.grey))
-    story.append(Spacer(1, 10))
-    story.append(Paragraph(
-        "This feedback letter was automatically generated by SkillMatch AI Job Portal. "
-        f"Reference: FEEDBACK-{user.id}-{job.id}-{timestamp}",
-        styles['Footer']
-    ))
-    
-    doc.build(story)
+    doc.build(story, filename=file_path)
     
-    return f"/static/uploads/letters/{filename}"
+    if output is not None:
+        return output
+    return public_url(relative)
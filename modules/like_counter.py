@@ -0,0 +1,104 @@
+"""
+Like Counter Module
+Buffers Post.likes_count changes in memory and writes them to the database
+as one aggregated UPDATE per post every LIKE_FLUSH_INTERVAL seconds, so a
+burst of likes on a popular post doesn't serialize on its row. Reads add the
+deltas this process hasn't flushed yet.
+"""
+from flask import current_app
+from sqlalchemy import update, select, bindparam, case, func
+import atexit
+import threading
+import time
+
+from extensions import db
+from models import Post, Like
+
+_deltas = {}
+_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+def _apply(deltas):
+    """One UPDATE per post, never letting a count go below zero"""
+    post = Post.__table__
+    count = func.coalesce(post.c.likes_count, 0) + bindparam('delta')
+    db.session.execute(
+        update(post).where(post.c.id == bindparam('post_id'))
+        .values(likes_count=case((count < 0, 0), else_=count)),
+        [{'post_id': post_id, 'delta': delta} for post_id, delta in deltas.items()]
+    )
+
+def add(post_id, delta):
+    """Record a committed like (+1) or unlike (-1).
+
+    Without WRITE_BEHIND_LIKES the count is updated and committed immediately.
+    """
+    if not current_app.config['WRITE_BEHIND_LIKES']:
+        _apply({post_id: delta})
+        db.session.commit()
+        return
+    with _lock:
+        _deltas[post_id] = _deltas.get(post_id, 0) + delta
+        if not _deltas[post_id]:
+            del _deltas[post_id]
+    _ensure_flusher(current_app._get_current_object())
+
+def pending(post_id):
+    with _lock:
+        return _deltas.get(post_id, 0)
+
+def like_count(post):
+    """A post's like count including deltas not yet flushed"""
+    return max((post.likes_count or 0) + pending(post.id), 0)
+
+def flush():
+    """Write buffered deltas to the database. Returns the number of posts updated."""
+    global _deltas
+    with _lock:
+        deltas, _deltas = _deltas, {}
+    if not deltas:
+        return 0
+    try:
+        _apply(deltas)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Put them back for the next flush
+        with _lock:
+            for post_id, delta in deltas.items():
+                _deltas[post_id] = _deltas.get(post_id, 0) + delta
+        raise
+    return len(deltas)
+
+def recount():
+    """Reset every likes_count from the Like table, dropping buffered deltas"""
+    with _lock:
+        _deltas.clear()
+    db.session.execute(
+        update(Post).values(likes_count=select(func.count(Like.id)).where(Like.post_id == Post.id).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+def _flush_in_context(app):
+    with app.app_context():
+        try:
+            flush()
+        except Exception:
+            app.logger.exception("Failed to flush like counts")
+        finally:
+            db.session.remove()
+
+def _run(app):
+    while True:
+        time.sleep(app.config['LIKE_FLUSH_INTERVAL'])
+        _flush_in_context(app)
+
+def _ensure_flusher(app):
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run, args=(app,), name='like-counter-flusher', daemon=True)
+            _flusher.start()
+            atexit.register(_flush_in_context, app)
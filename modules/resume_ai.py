@@ -389,12 +389,13 @@ def upload_resume():
         return jsonify({'success': False, 'message': 'Only PDF files are allowed'})
     
     # Save file
+    from modules.storage import save_upload, relative_from_url, local_path
+    
     filename = secure_filename(f"{current_user.id}_{file.filename}")
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'resumes', filename)
-    file.save(file_path)
+    file_url = save_upload(file, 'resumes', filename)
     
     # Parse resume
-    result = parse_resume(file_path)
+    result = parse_resume(local_path(relative_from_url(file_url)))
     
     if not result['success']:
         return jsonify(result)
@@ -406,7 +407,7 @@ def upload_resume():
     if not resume:
         resume = Resume(user_id=current_user.id)
     
-    resume.file_path = f"/static/uploads/resumes/{filename}"
+    resume.file_path = file_url
     resume.ats_score = resume_data['ats_score']
     resume.skills_extracted = json.dumps(resume_data['skills'])
     resume.keywords = json.dumps(resume_data.get('keywords', []))
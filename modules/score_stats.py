@@ -0,0 +1,103 @@
+"""
+Score Statistics Module
+Per-test score histograms maintained on every submission, answering
+percentile and distribution queries without scanning the result tables.
+Each bucket holds one exact score; psychological scores can exceed 100.
+"""
+from collections import Counter
+import numbers
+from sqlalchemy import func, case, insert
+
+from extensions import db
+from models import PsychologicalTestResult, SkillTestResult, TestScoreBucket
+from schema import increment
+
+MIN_SCORE = 0
+
+RESULT_MODELS = {
+    'psychology': PsychologicalTestResult,
+    'skill': SkillTestResult
+}
+
+def validate_score(score):
+    """The score as an int, or ValueError if it isn't a whole number of at least MIN_SCORE"""
+    if isinstance(score, bool) or not isinstance(score, numbers.Real) or score != int(score) or score < MIN_SCORE:
+        raise ValueError(f"Invalid test score: {score!r}")
+    return int(score)
+
+def record_scores(test_type, test_id, scores):
+    """Add scores to a test's histogram in the current transaction"""
+    counts = Counter(validate_score(score) for score in scores)
+    # Atomic increment, so concurrent submissions never lose a count
+    increment(TestScoreBucket, ['test_type', 'test_id', 'score'], 'count',
+              [{'test_type': test_type, 'test_id': test_id, 'score': score, 'count': count}
+               for score, count in sorted(counts.items())])
+
+def record_score(test_type, test_id, score):
+    record_scores(test_type, test_id, [score])
+
+def histogram(test_type, test_id):
+    """[(score, count)] for a test, lowest score first"""
+    return db.session.query(TestScoreBucket.score, TestScoreBucket.count)\
+        .filter_by(test_type=test_type, test_id=test_id)\
+        .order_by(TestScoreBucket.score)\
+        .all()
+
+def percentile_rank(test_type, test_id, score):
+    """Percentage of results for the test that scored lower than score, or None without results"""
+    if score is None:
+        return None
+    below, total = db.session.query(
+        func.coalesce(func.sum(case((TestScoreBucket.score < score, TestScoreBucket.count), else_=0)), 0),
+        func.coalesce(func.sum(TestScoreBucket.count), 0)
+    ).filter_by(test_type=test_type, test_id=test_id).one()
+    if not total:
+        return None
+    return round(100.0 * below / total, 1)
+
+def distribution(test_type, test_id, width=10):
+    """Result counts in score ranges of `width` points from 0 to 100, or to the
+    highest score if that's higher, plus total and median"""
+    rows = histogram(test_type, test_id)
+    total = sum(count for _, count in rows)
+    highest = max([100] + [score for score, _ in rows])
+
+    ranges = {}
+    for start in range(MIN_SCORE, highest + 1, width):
+        ranges[start] = 0
+    for score, count in rows:
+        ranges[MIN_SCORE + (score - MIN_SCORE) // width * width] += count
+
+    median = None
+    seen = 0
+    for score, count in rows:
+        seen += count
+        if seen * 2 >= total:
+            median = score
+            break
+
+    return {
+        'total': total,
+        'median': median,
+        'buckets': [{'from': start, 'to': min(start + width - 1, highest), 'count': count}
+                    for start, count in ranges.items()]
+    }
+
+def backfill():
+    """Rebuild every histogram from the result tables. Returns the number of results counted.
+    Results without a score or with a negative one aren't counted."""
+    TestScoreBucket.query.delete()
+    counted = 0
+    for test_type, model in RESULT_MODELS.items():
+        rows = db.session.query(model.test_id, model.score, func.count())\
+            .filter(model.score >= MIN_SCORE)\
+            .group_by(model.test_id, model.score)\
+            .all()
+        if rows:
+            db.session.execute(insert(TestScoreBucket), [
+                {'test_type': test_type, 'test_id': test_id, 'score': score, 'count': count}
+                for test_id, score, count in rows
+            ])
+            counted += sum(count for _, _, count in rows)
+    db.session.commit()
+    return counted
@@ -1,44 +1,82 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime
+import click
 import json
 
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload
+
 from extensions import db
 from models import Post, Comment, Like, Connection, User, Skill, Endorsement
+from modules.trending import top_skills
+from schema import insert_ignore
+
+social_bp = Blueprint('social_bp', __name__, url_prefix='/social', cli_group='social')
+
+# Comments shown under each post in the feed
+FEED_COMMENTS = 3
 
-social_bp = Blueprint('social_bp', __name__, url_prefix='/social')
+def load_feed_posts(post_ids, user_id):
+    """Posts with their authors, plus the comment counts, first comments and
+    the posts the user liked, in a fixed number of queries for the whole page"""
+    if not post_ids:
+        return [], {}, {}, set()
+    
+    posts = Post.query.options(joinedload(Post.author))\
+        .filter(Post.id.in_(post_ids))\
+        .order_by(Post.id.desc())\
+        .all()
+    
+    comment_counts = dict(db.session.query(Comment.post_id, func.count(Comment.id))
+                          .filter(Comment.post_id.in_(post_ids))
+                          .group_by(Comment.post_id))
+    
+    position = func.row_number().over(partition_by=Comment.post_id, order_by=Comment.id).label('position')
+    first = db.session.query(Comment.id, position).filter(Comment.post_id.in_(post_ids)).subquery()
+    comments = {}
+    for comment in Comment.query.options(joinedload(Comment.user))\
+            .join(first, first.c.id == Comment.id)\
+            .filter(first.c.position <= FEED_COMMENTS)\
+            .order_by(Comment.id):
+        comments.setdefault(comment.post_id, []).append(comment)
+    
+    liked = {post_id for (post_id,) in db.session.query(Like.post_id)
+             .filter(Like.user_id == user_id, Like.post_id.in_(post_ids))}
+    return posts, comment_counts, comments, liked
 
 @social_bp.route('/feed')
 @login_required
 def feed():
-    # Get posts from connections and own posts
-    connection_ids = [c.connected_user_id for c in 
-                     Connection.query.filter_by(user_id=current_user.id, status='accepted').all()]
-    connection_ids.append(current_user.id)
+    from modules.timeline import read_timeline
+    from modules.connection_graph import suggest
     
-    posts = Post.query.filter(Post.user_id.in_(connection_ids))\
-                     .order_by(Post.created_at.desc())\
-                     .limit(20).all()
+    # Posts from connections and own posts, precomputed when they were created
+    before = request.args.get('before', type=int)
+    post_ids = read_timeline(current_user.id, limit=20, before=before)
+    posts, comment_counts, comments, liked = load_feed_posts(post_ids, current_user.id)
+    older = post_ids[-1] if len(post_ids) == 20 else None
     
-    # Get trending skills (simplified)
-    trending_skills = ['Python', 'React', 'Machine Learning', 'AWS', 'Docker', 'TypeScript']
+    # Skills trending across jobs, profiles, endorsements and posts
+    trending_skills = top_skills(6)
     
-    # Get connection suggestions
-    my_skills = [s.name.lower() for s in Skill.query.filter_by(user_id=current_user.id).all()]
-    
-    suggestions = User.query.filter(
-        User.id != current_user.id,
-        User.role == 'seeker'
-    ).limit(5).all()
+    # People you may know, by mutual connections and shared skills
+    suggestions = suggest(current_user.id, k=5)
     
     return render_template('social/feed.html', 
                          posts=posts, 
+                         comment_counts=comment_counts,
+                         comments=comments,
+                         liked=liked,
+                         older=older,
                          trending_skills=trending_skills,
                          suggestions=suggestions)
 
 @social_bp.route('/post', methods=['POST'])
 @login_required
 def create_post():
+    from modules.timeline import fan_out
+    
     data = request.get_json() if request.is_json else request.form
     
     post = Post(
@@ -49,6 +87,8 @@ def create_post():
     )
     
     db.session.add(post)
+    db.session.flush()
+    fan_out(post)
     db.session.commit()
     
     # If it's a job update or shared profile, add extra metadata if needed
@@ -62,26 +102,28 @@ def create_post():
 @social_bp.route('/post/<int:post_id>/like', methods=['POST'])
 @login_required
 def like_post(post_id):
-    post = Post.query.get_or_404(post_id)
+    from modules.like_counter import add, like_count
     
-    existing_like = Like.query.filter_by(post_id=post_id, user_id=current_user.id).first()
+    post = Post.query.get_or_404(post_id)
     
-    if existing_like:
-        db.session.delete(existing_like)
-        post.likes_count = max(0, post.likes_count - 1)
-        liked = False
-    else:
-        like = Like(post_id=post_id, user_id=current_user.id)
-        db.session.add(like)
-        post.likes_count += 1
+    # Toggle with one statement either way; the unique (post_id, user_id) index
+    # makes a concurrent second like a no-op instead of a duplicate row
+    inserted = insert_ignore(Like, [{'post_id': post_id, 'user_id': current_user.id, 'created_at': datetime.utcnow()}])
+    if inserted:
         liked = True
-    
+    else:
+        deleted = Like.query.filter_by(post_id=post_id, user_id=current_user.id).delete(synchronize_session=False)
+        liked = False
+        inserted = -deleted
     db.session.commit()
     
+    if inserted:
+        add(post_id, inserted)
+    
     return jsonify({
         'success': True,
         'liked': liked,
-        'likes_count': post.likes_count
+        'likes_count': like_count(post)
     })
 
 @social_bp.route('/post/<int:post_id>/comment', methods=['POST'])
@@ -137,13 +179,24 @@ def send_connection(user_id):
 @social_bp.route('/connection/<int:connection_id>/accept', methods=['POST'])
 @login_required
 def accept_connection(connection_id):
+    from modules.timeline import on_connection_accepted
+    from modules.connection_graph import connection_added
+    
     connection = Connection.query.get_or_404(connection_id)
     
     if connection.connected_user_id != current_user.id:
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    connection.status = 'accepted'
+    # Conditional update, so a repeated accept doesn't count the connection twice
+    accepted = Connection.query.filter(Connection.id == connection_id, Connection.status != 'accepted')\
+        .update({Connection.status: 'accepted'}, synchronize_session=False)
+    if accepted:
+        User.query.filter(User.id.in_([connection.user_id, connection.connected_user_id]))\
+            .update({User.connection_count: func.coalesce(User.connection_count, 0) + 1}, synchronize_session=False)
+        on_connection_accepted(connection.user_id, connection.connected_user_id)
     db.session.commit()
+    if accepted:
+        connection_added(connection.user_id, connection.connected_user_id)
     
     return jsonify({
         'success': True,
@@ -153,13 +206,24 @@ def accept_connection(connection_id):
 @social_bp.route('/connection/<int:connection_id>/reject', methods=['POST'])
 @login_required
 def reject_connection(connection_id):
+    from modules.timeline import on_connection_removed
+    from modules.connection_graph import connection_removed
+    
     connection = Connection.query.get_or_404(connection_id)
     
     if connection.connected_user_id != current_user.id:
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
+    was_accepted = connection.status == 'accepted'
+    if was_accepted:
+        count = func.coalesce(User.connection_count, 0) - 1
+        User.query.filter(User.id.in_([connection.user_id, connection.connected_user_id]))\
+            .update({User.connection_count: case((count < 0, 0), else_=count)}, synchronize_session=False)
+        on_connection_removed(connection.user_id, connection.connected_user_id)
     db.session.delete(connection)
     db.session.commit()
+    if was_accepted:
+        connection_removed(connection.user_id, connection.connected_user_id)
     
     return jsonify({
         'success': True,
@@ -208,3 +272,35 @@ def endorse_skill(skill_id):
         'success': True,
         'endorsements': skill.endorsements
     })
+
+@social_bp.cli.command('rebuild-timelines')
+def rebuild_timelines_command():
+    """Recount connections and rebuild every feed timeline from existing posts"""
+    from modules.timeline import rebuild
+    entries = rebuild()
+    click.echo(f"Rebuilt timelines with {entries} entries")
+
+@social_bp.cli.command('trim-timelines')
+def trim_timelines_command():
+    """Trim every feed timeline to TIMELINE_LENGTH entries"""
+    from modules.timeline import trim
+    from models import TimelineEntry
+    user_ids = [user_id for (user_id,) in db.session.query(TimelineEntry.user_id).distinct()]
+    trim(user_ids)
+    db.session.commit()
+    click.echo(f"Trimmed {len(user_ids)} timelines")
+
+@social_bp.cli.command('dedupe-likes')
+def dedupe_likes_command():
+    """Delete duplicate likes, keeping the first, before creating the unique index"""
+    keep = db.session.query(func.min(Like.id)).group_by(Like.post_id, Like.user_id)
+    deleted = Like.query.filter(Like.id.not_in(keep)).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Deleted {deleted} duplicate likes")
+
+@social_bp.cli.command('recount-likes')
+def recount_likes_command():
+    """Recompute every post's like count from the likes table"""
+    from modules.like_counter import recount
+    recount()
+    click.echo("Recounted likes")
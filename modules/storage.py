@@ -0,0 +1,161 @@
+"""
+Storage Module
+Keeps uploaded and generated files in hash-sharded directories under
+UPLOAD_FOLDER, tracks them in the StoredFile manifest and garbage-collects
+files nothing references any more
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+import hashlib
+import os
+
+from extensions import db
+from models import User, Resume, Application, Certificate, StoredFile
+
+URL_PREFIX = '/static/uploads/'
+
+# Column that references the files of each kind
+REFERENCE_COLUMNS = {
+    'resumes': Resume.file_path,
+    'profiles': User.profile_image,
+    'certificates': Certificate.file_path,
+    'letters': Application.letter_path
+}
+
+def shard(filename):
+    """Two levels of 256 directories picked by the hash of the file name"""
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return digest[:2], digest[2:4]
+
+def relative_path(kind, filename):
+    """Sharded path of a file relative to UPLOAD_FOLDER, e.g. resumes/3f/a2/1_cv.pdf"""
+    return '/'.join((kind, *shard(filename), filename))
+
+def public_url(relative):
+    return URL_PREFIX + relative
+
+def relative_from_url(url):
+    """Inverse of public_url, None for URLs that aren't stored files"""
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    return url[len(URL_PREFIX):]
+
+def local_path(relative):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], *relative.split('/'))
+
+def reserve(kind, filename):
+    """Return (local path, relative path) to write a new file to, creating its shard directory"""
+    relative = relative_path(kind, filename)
+    path = local_path(relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path, relative
+
+def register(relative, kind):
+    """Record a written file in the manifest and return its public URL.
+
+    The caller commits, together with the row that references the file.
+    """
+    entry = StoredFile.query.filter_by(path=relative).first()
+    if entry is None:
+        entry = StoredFile(path=relative, kind=kind)
+        db.session.add(entry)
+    entry.size = os.path.getsize(local_path(relative))
+    entry.stored_at = datetime.utcnow()
+    return public_url(relative)
+
+def save_upload(file, kind, filename):
+    """Save an uploaded FileStorage into its shard and return its public URL"""
+    path, relative = reserve(kind, filename)
+    file.save(path)
+    return register(relative, kind)
+
+def referenced_paths():
+    """Counter of relative paths referenced from the database"""
+    references = Counter()
+    for column in REFERENCE_COLUMNS.values():
+        for (url,) in db.session.query(column).filter(column.like(URL_PREFIX + '%')).yield_per(1000):
+            references[relative_from_url(url)] += 1
+    return references
+
+def collect_garbage(grace=None, dry_run=False):
+    """Delete stored files that no row references and that are older than the grace period.
+
+    Also refreshes the reference counts in the manifest. Returns a summary
+    with the number of files scanned and removed and the bytes freed.
+    """
+    if grace is None:
+        grace = timedelta(hours=current_app.config['STORAGE_GC_GRACE_HOURS'])
+    cutoff = datetime.utcnow() - grace
+    references = referenced_paths()
+
+    entries = db.session.query(
+        StoredFile.id, StoredFile.path, StoredFile.size, StoredFile.references, StoredFile.stored_at
+    ).all()
+
+    updates = []
+    garbage = []
+    freed = 0
+    for entry_id, path, size, old_count, stored_at in entries:
+        count = references.get(path, 0)
+        if count == 0 and stored_at is not None and stored_at < cutoff:
+            garbage.append(entry_id)
+            freed += size or 0
+            if not dry_run:
+                try:
+                    os.remove(local_path(path))
+                except FileNotFoundError:
+                    pass
+        elif count != old_count:
+            updates.append({'id': entry_id, 'references': count})
+
+    if not dry_run:
+        db.session.bulk_update_mappings(StoredFile, updates)
+        for start in range(0, len(garbage), 500):
+            StoredFile.query.filter(StoredFile.id.in_(garbage[start:start + 500]))\
+                .delete(synchronize_session=False)
+        db.session.commit()
+
+    return {'scanned': len(entries), 'removed': len(garbage), 'bytes_freed': freed}
+
+def migrate_existing():
+    """Move files from the old flat directories into shards and record every file in the manifest.
+
+    References in the database are rewritten to the new URLs. Safe to re-run.
+    The letter cache (letters/cache) is managed by its own LRU eviction and is left alone.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    known = {path for (path,) in db.session.query(StoredFile.path)}
+    moved = 0
+    registered = 0
+
+    for kind, column in REFERENCE_COLUMNS.items():
+        directory = os.path.join(upload_folder, kind)
+        if not os.path.isdir(directory):
+            continue
+
+        # Flat files from before sharding
+        with os.scandir(directory) as it:
+            flat = [entry.name for entry in it if entry.is_file()]
+        for filename in flat:
+            path, relative = reserve(kind, filename)
+            os.replace(os.path.join(directory, filename), path)
+            old_url = public_url(f"{kind}/{filename}")
+            column.class_.query.filter(column == old_url)\
+                .update({column: public_url(relative)}, synchronize_session=False)
+            moved += 1
+
+        # Sharded files missing from the manifest
+        for root, dirs, files in os.walk(directory):
+            if root == directory:
+                dirs[:] = [d for d in dirs if len(d) == 2]
+                continue
+            for filename in files:
+                relative = os.path.relpath(os.path.join(root, filename), upload_folder).replace(os.sep, '/')
+                if relative not in known:
+                    register(relative, kind)
+                    known.add(relative)
+                    registered += 1
+
+    db.session.commit()
+    return {'moved': moved, 'registered': registered}
@@ -0,0 +1,151 @@
+"""
+Test Definition Cache
+Parsed questions and answer keys of psychological and skill tests, kept per
+process and keyed by test ID and version, and per-user summaries of the
+tests index, reloaded when the tests or the user's results change in any
+process (see the FeedVersion counters in modules/feeds.py)
+"""
+from collections import namedtuple, OrderedDict
+from sqlalchemy import event, func
+import json
+import threading
+
+import numpy as np
+
+from extensions import db
+from models import PsychologicalTest, SkillTest, PsychologicalTestResult, SkillTestResult
+from modules.feeds import bump_feed_version, bump_feed_versions, feed_version
+
+# questions: tuple of {'text', 'options'} dicts, without the correct answers
+# answer_key: array of the correct option per question (skill tests only)
+ParsedTest = namedtuple('ParsedTest', ['version', 'questions', 'answer_key'])
+
+_cache = {}
+_lock = threading.Lock()
+
+# Change counters behind the completion summaries: one for the tests themselves
+# and one per user for their results
+TESTS_FEED = 'tests'
+SUMMARY_MAX_USERS = 10000
+_summaries = OrderedDict()
+
+def parse_questions(questions_json):
+    """Split a questions_json document into display questions and an answer key"""
+    raw = json.loads(questions_json)
+    questions = tuple({'text': q.get('text'), 'options': q.get('options')} for q in raw)
+    answer_key = np.array([str(q.get('correct', '')) for q in raw], dtype=str)
+    return questions, answer_key
+
+def get_test(model, test_id, version):
+    """Return the ParsedTest for a test, parsing its questions_json on a miss.
+
+    The caller passes the version it loaded so edits made by other
+    processes are picked up without any cross-process invalidation.
+    """
+    key = (model.__tablename__, test_id)
+    entry = _cache.get(key)
+    if entry is not None and entry.version == version:
+        return entry
+
+    questions_json = db.session.query(model.questions_json).filter(model.id == test_id).scalar()
+    if questions_json is None:
+        return None
+    questions, answer_key = parse_questions(questions_json)
+    entry = ParsedTest(version, questions, answer_key)
+    with _lock:
+        _cache[key] = entry
+    return entry
+
+# Minimum skill test score for a pass and a certificate
+PASS_SCORE = 70
+
+def grade(parsed, answers):
+    """Number of correct answers for a list of submitted option keys"""
+    submitted = np.array([a or '' for a in answers], dtype=str)
+    return int(np.count_nonzero(submitted == parsed.answer_key))
+
+def grade_many(parsed, submissions):
+    """Scores (0-100) for many answer lists at once.
+
+    Each submission is padded or truncated to the number of questions and
+    the whole batch is compared with the answer key in one array operation.
+    """
+    count = len(parsed.answer_key)
+    if not submissions or not count:
+        return np.zeros(len(submissions), dtype=int)
+    padding = [''] * count
+    matrix = np.array([([a or '' for a in answers] + padding)[:count] for answers in submissions], dtype=str)
+    correct = np.count_nonzero(matrix == parsed.answer_key, axis=1)
+    return (correct / count * 100).astype(int)
+
+def invalidate(model, test_id=None):
+    """Drop one test, or every test of a model, from this process's cache"""
+    with _lock:
+        if test_id is None:
+            for key in [k for k in _cache if k[0] == model.__tablename__]:
+                del _cache[key]
+        else:
+            _cache.pop((model.__tablename__, test_id), None)
+
+def _latest_results(model, user_id):
+    """Subquery of the user's latest result id per test"""
+    return db.session.query(model.test_id, func.max(model.id).label('result_id'))\
+        .filter(model.user_id == user_id)\
+        .group_by(model.test_id)\
+        .subquery()
+
+def load_summary(user_id):
+    """Test metadata with the user's latest result, one LEFT JOIN query per test type"""
+    latest = _latest_results(PsychologicalTestResult, user_id)
+    psych_tests = db.session.query(
+        PsychologicalTest.id, PsychologicalTest.title, PsychologicalTest.description, latest.c.result_id
+    ).outerjoin(latest, latest.c.test_id == PsychologicalTest.id)\
+        .order_by(PsychologicalTest.id)\
+        .all()
+
+    latest = _latest_results(SkillTestResult, user_id)
+    skill_tests = db.session.query(
+        SkillTest.id, SkillTest.skill_name, SkillTest.level, SkillTest.duration_minutes,
+        latest.c.result_id, SkillTestResult.is_passed
+    ).outerjoin(latest, latest.c.test_id == SkillTest.id)\
+        .outerjoin(SkillTestResult, SkillTestResult.id == latest.c.result_id)\
+        .order_by(SkillTest.id)\
+        .all()
+
+    return {'psych_tests': psych_tests, 'skill_tests': skill_tests}
+
+def results_feed(user_id):
+    return f'test-results:{user_id}'
+
+def record_results(*user_ids):
+    """Mark the users' completion summaries stale in the current transaction"""
+    bump_feed_versions([results_feed(user_id) for user_id in user_ids])
+
+def completion_summary(user_id):
+    """load_summary(), reused while neither the tests nor the user's results have changed"""
+    version = feed_version(TESTS_FEED, results_feed(user_id))[0]
+    with _lock:
+        entry = _summaries.get(user_id)
+        if entry is not None and entry[0] == version:
+            _summaries.move_to_end(user_id)
+            return entry[1]
+
+    summary = load_summary(user_id)
+    with _lock:
+        _summaries[user_id] = (version, summary)
+        _summaries.move_to_end(user_id)
+        while len(_summaries) > SUMMARY_MAX_USERS:
+            _summaries.popitem(last=False)
+    return summary
+
+def _on_change(mapper, connection, target):
+    invalidate(type(target), target.id)
+    bump_feed_version(TESTS_FEED, connection)
+
+def _on_insert(mapper, connection, target):
+    bump_feed_version(TESTS_FEED, connection)
+
+for _model in (PsychologicalTest, SkillTest):
+    event.listen(_model, 'after_insert', _on_insert)
+    event.listen(_model, 'after_update', _on_change)
+    event.listen(_model, 'after_delete', _on_change)
@@ -1,54 +1,57 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, send_file
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, send_file, abort
 from flask_login import login_required, current_user
-from datetime import datetime
-import json
-import os
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+from sqlalchemy.orm import defer
+import click
+import time
 
 from extensions import db
 from models import User, PsychologicalTest, PsychologicalTestResult, SkillTest, SkillTestResult, Certificate
+from modules.test_cache import get_test, grade, completion_summary, record_results, PASS_SCORE
+from modules.certificate_queue import enqueue
+from modules.score_stats import record_score, percentile_rank, distribution, RESULT_MODELS
 
-tests_bp = Blueprint('tests_bp', __name__, url_prefix='/tests')
+tests_bp = Blueprint('tests_bp', __name__, url_prefix='/tests', cli_group='tests')
+
+def get_test_or_404(model, test):
+    """The parsed questions of a test, or 404 if it was deleted or has no questions"""
+    parsed = get_test(model, test.id, test.version)
+    if parsed is None or not parsed.questions:
+        abort(404)
+    return parsed
 
 @tests_bp.route('/')
 @login_required
 def index():
-    psych_tests = PsychologicalTest.query.all()
-    skill_tests = SkillTest.query.all()
-    
-    # Get user's completed tests
-    completed_psych = {r.test_id: r for r in PsychologicalTestResult.query.filter_by(user_id=current_user.id).all()}
-    completed_skill = {r.test_id: r for r in SkillTestResult.query.filter_by(user_id=current_user.id).all()}
+    # Test metadata and the user's latest result per test, cached until the next submission
+    summary = completion_summary(current_user.id)
     
     return render_template('tests/index.html', 
-                           psych_tests=psych_tests, 
-                           skill_tests=skill_tests,
-                           completed_psych=completed_psych,
-                           completed_skill=completed_skill)
+                           psych_tests=summary['psych_tests'], 
+                           skill_tests=summary['skill_tests'])
 
 @tests_bp.route('/psychological/<int:test_id>')
 @login_required
 def take_psych_test(test_id):
-    test = PsychologicalTest.query.get_or_404(test_id)
-    questions = json.loads(test.questions_json)
-    return render_template('tests/take_psych.html', test=test, questions=questions)
+    test = PsychologicalTest.query.options(defer(PsychologicalTest.questions_json)).get_or_404(test_id)
+    parsed = get_test_or_404(PsychologicalTest, test)
+    return render_template('tests/take_psych.html', test=test, questions=parsed.questions)
 
 @tests_bp.route('/psychological/<int:test_id>/submit', methods=['POST'])
 @login_required
 def submit_psych_test(test_id):
-    test = PsychologicalTest.query.get_or_404(test_id)
+    test = PsychologicalTest.query.options(defer(PsychologicalTest.questions_json)).get_or_404(test_id)
+    parsed = get_test_or_404(PsychologicalTest, test)
     data = request.form
     
-    # Simple scoring logic: sum of numerical values
+    # Simple scoring logic: sum of the chosen option values, one answer per question
     score = 0
-    responses = {}
-    for key, value in data.items():
-        if key.startswith('q_'):
-            score += int(value)
-            responses[key] = value
+    for i, question in enumerate(parsed.questions):
+        values = {str(option['value']) for option in question['options'] or []
+                  if isinstance(option, dict) and type(option.get('value')) is int}
+        value = data.get(f'q_{i}')
+        if value not in values:
+            abort(400)
+        score += int(value)
             
     # Generate analysis based on score
     analysis = "Your psychological profile indicates a balanced professional approach."
@@ -64,35 +67,36 @@ def submit_psych_test(test_id):
         analysis=analysis
     )
     db.session.add(result)
-    db.session.commit()
+    db.session.flush()
+    record_score('psychology', test_id, score)
     
-    # Generate certificate
-    generate_test_certificate(result, 'psychology')
+    # Certificate is rendered in the background, the result page shows it once ready
+    cert = queue_test_certificate(result, 'psychology', f"Psychological Assessment: {test.title}")
+    record_results(current_user.id)
+    db.session.commit()
+    enqueue(cert.id)
     
     return redirect(url_for('tests_bp.test_result', result_id=result.id, type='psychology'))
 
 @tests_bp.route('/skill/<int:test_id>')
 @login_required
 def take_skill_test(test_id):
-    test = SkillTest.query.get_or_404(test_id)
-    questions = json.loads(test.questions_json)
-    return render_template('tests/take_skill.html', test=test, questions=questions)
+    test = SkillTest.query.options(defer(SkillTest.questions_json)).get_or_404(test_id)
+    parsed = get_test_or_404(SkillTest, test)
+    return render_template('tests/take_skill.html', test=test, questions=parsed.questions)
 
 @tests_bp.route('/skill/<int:test_id>/submit', methods=['POST'])
 @login_required
 def submit_skill_test(test_id):
-    test = SkillTest.query.get_or_404(test_id)
-    questions = json.loads(test.questions_json)
+    test = SkillTest.query.options(defer(SkillTest.questions_json)).get_or_404(test_id)
+    parsed = get_test_or_404(SkillTest, test)
     data = request.form
     
-    correct_count = 0
-    for i, q in enumerate(questions):
-        answer = data.get(f'q_{i}')
-        if answer == q.get('correct'):
-            correct_count += 1
+    answers = [data.get(f'q_{i}') for i in range(len(parsed.questions))]
+    correct_count = grade(parsed, answers)
             
-    score = int((correct_count / len(questions)) * 100)
-    is_passed = score >= 70
+    score = int((correct_count / len(parsed.questions)) * 100)
+    is_passed = score >= PASS_SCORE
     
     result = SkillTestResult(
         user_id=current_user.id,
@@ -101,13 +105,35 @@ def submit_skill_test(test_id):
         is_passed=is_passed
     )
     db.session.add(result)
-    db.session.commit()
+    db.session.flush()
+    record_score('skill', test_id, score)
     
-    if is_passed:
-        generate_test_certificate(result, 'skill')
+    cert = queue_test_certificate(result, 'skill', f"Skill Certification: {test.skill_name}") if is_passed else None
+    record_results(current_user.id)
+    db.session.commit()
+    if cert:
+        enqueue(cert.id)
         
     return redirect(url_for('tests_bp.test_result', result_id=result.id, type='skill'))
 
+@tests_bp.cli.command('grade')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+def grade_command(path, batch_size):
+    """Grade a JSONL file of skill test submissions"""
+    from modules.bulk_grading import grade_submissions
+    
+    started = time.perf_counter()
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        # The CLI exits when grading ends, so certificates can't be left to the background worker
+        summary = grade_submissions(stream, batch_size=batch_size, render_inline=True)
+    elapsed = time.perf_counter() - started
+    
+    for error in summary['errors']:
+        click.echo(f"Row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Graded {summary['graded']} submissions ({summary['passed']} passed, certificates rendered), "
+               f"{summary['failed']} failed in {elapsed:.2f}s")
+
 @tests_bp.route('/result/<int:result_id>')
 @login_required
 def test_result(result_id):
@@ -125,68 +151,49 @@ def test_result(result_id):
         reference_id=result_id
     ).first()
     
-    return render_template('tests/result.html', result=result, test=test, type=test_type, certificate=certificate)
-
-def generate_test_certificate(result, cert_type):
-    """Generate a PDF certificate for the test result"""
-    cert_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'certificates')
-    os.makedirs(cert_dir, exist_ok=True)
-    
-    filename = f"cert_{cert_type}_{result.id}.pdf"
-    filepath = os.path.join(cert_dir, filename)
-    
-    # Get test info
-    if cert_type == 'psychology':
-        test = PsychologicalTest.query.get(result.test_id)
-        title = f"Psychological Assessment: {test.title}"
-    else:
-        test = SkillTest.query.get(result.test_id)
-        title = f"Skill Certification: {test.skill_name}"
-        
-    # PDF generation
-    c = canvas.Canvas(filepath, pagesize=letter)
-    width, height = letter
-    
-    # Border
-    c.setStrokeColor(colors.gold)
-    c.setLineWidth(5)
-    c.rect(0.5*inch, 0.5*inch, width-1*inch, height-1*inch)
+    percentile = percentile_rank(test_type, result.test_id, result.score)
     
-    # Content
-    c.setFont("Helvetica-Bold", 30)
-    c.drawCentredString(width/2, height - 2*inch, "CERTIFICATE OF COMPLETION")
-    
-    c.setFont("Helvetica", 18)
-    c.drawCentredString(width/2, height - 3*inch, "This is to certify that")
-    
-    c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(width/2, height - 4*inch, current_user.name.upper())
-    
-    c.setFont("Helvetica", 18)
-    c.drawCentredString(width/2, height - 5*inch, "has successfully completed the")
-    
-    c.setFont("Helvetica-Bold", 20)
-    c.drawCentredString(width/2, height - 6*inch, title)
-    
-    if cert_type == 'skill':
-        c.setFont("Helvetica", 16)
-        c.drawCentredString(width/2, height - 6.5*inch, f"with a score of {result.score}%")
-    
-    c.setFont("Helvetica", 14)
-    c.drawCentredString(width/2, height - 8*inch, f"Date: {datetime.utcnow().strftime('%B %d, %Y')}")
-    c.drawCentredString(width/2, height - 8.5*inch, f"Certificate ID: JOB-{cert_type[:3].upper()}-{result.id}")
+    return render_template('tests/result.html', result=result, test=test, type=test_type,
+                           certificate=certificate, percentile=percentile)
+
+@tests_bp.route('/<test_type>/<int:test_id>/stats')
+@login_required
+def test_stats(test_type, test_id):
+    """Score distribution of a test, and the percentile of ?score= if given"""
+    if test_type not in RESULT_MODELS:
+        return jsonify({'success': False, 'message': 'Unknown test type'})
+    
+    stats = distribution(test_type, test_id)
+    score = request.args.get('score', type=int)
+    if score is not None:
+        stats['percentile'] = percentile_rank(test_type, test_id, score)
+    return jsonify({'success': True, **stats})
+
+@tests_bp.cli.command('backfill-stats')
+def backfill_stats_command():
+    """Rebuild the score histograms from all existing test results"""
+    from modules.score_stats import backfill
     
-    c.save()
+    counted = backfill()
+    click.echo(f"Rebuilt score histograms from {counted} results")
+
+@tests_bp.route('/certificates/<int:cert_id>/status')
+@login_required
+def certificate_status(cert_id):
+    """Polled by the result page while a certificate is being generated"""
+    cert = Certificate.query.get_or_404(cert_id)
+    if cert.user_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    # Save search record in DB
+    return jsonify({'success': True, 'ready': cert.file_path is not None, 'file_path': cert.file_path})
+
+def queue_test_certificate(result, cert_type, title):
+    """Add a certificate row for the test result; the PDF is rendered after commit by enqueue()"""
     cert = Certificate(
         user_id=current_user.id,
         cert_type=cert_type,
         reference_id=result.id,
-        title=title,
-        file_path=f"/static/uploads/certificates/{filename}"
+        title=title
     )
     db.session.add(cert)
-    db.session.commit()
-    
-    return cert.file_path
+    return cert
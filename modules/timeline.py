@@ -0,0 +1,161 @@
+"""
+Timeline Module
+Per-user feeds of post IDs, filled when a post is created (fan-out on write)
+and read with one range scan. Posts by accounts with very many connections
+are merged in at read time instead (fan-out on read).
+"""
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import union, union_all, select
+import random
+import threading
+import time
+
+from extensions import db
+from models import User, Post, Connection, TimelineEntry
+from schema import insert_ignore, insert_ignore_from
+
+# Each timeline is trimmed on roughly one in TRIM_INTERVAL fan-outs it receives,
+# so timelines stay within about TIMELINE_LENGTH + TRIM_INTERVAL entries
+TRIM_INTERVAL = 50
+
+# Posts copied both ways when a connection is accepted
+ACCEPT_BACKFILL = 20
+
+# Per-process cache of the large accounts each user is connected with
+LARGE_CONNECTIONS_TTL = 300
+LARGE_CONNECTIONS_MAX_USERS = 10000
+_large_connections = OrderedDict()
+_large_connections_lock = threading.Lock()
+
+def connected_user_ids(user_id):
+    """IDs of a user's accepted connections, in either direction"""
+    outgoing = select(Connection.connected_user_id).where(
+        Connection.user_id == user_id, Connection.status == 'accepted')
+    incoming = select(Connection.user_id).where(
+        Connection.connected_user_id == user_id, Connection.status == 'accepted')
+    return set(db.session.scalars(union(outgoing, incoming)))
+
+def is_large_account(user_id):
+    count = db.session.query(User.connection_count).filter(User.id == user_id).scalar()
+    return (count or 0) > current_app.config['TIMELINE_FANOUT_LIMIT']
+
+def trim(user_ids, length=None):
+    """Drop all but the newest `length` entries from the given timelines"""
+    length = length or current_app.config['TIMELINE_LENGTH']
+    for user_id in user_ids:
+        cutoff = db.session.query(TimelineEntry.post_id)\
+            .filter(TimelineEntry.user_id == user_id)\
+            .order_by(TimelineEntry.post_id.desc())\
+            .offset(length - 1).limit(1)\
+            .scalar()
+        if cutoff is not None:
+            TimelineEntry.query.filter(TimelineEntry.user_id == user_id, TimelineEntry.post_id < cutoff)\
+                .delete(synchronize_session=False)
+
+def fan_out(post):
+    """Add a new post to its author's timeline and, unless the author is a large account,
+    to the timelines of all their connections. Runs in the caller's transaction."""
+    readers = {post.user_id}
+    if not is_large_account(post.user_id):
+        readers |= connected_user_ids(post.user_id)
+
+    insert_ignore(TimelineEntry, [{'user_id': reader, 'post_id': post.id} for reader in readers])
+    trim([reader for reader in readers if random.random() < 1.0 / TRIM_INTERVAL])
+
+def on_connection_accepted(user_a, user_b):
+    """Seed both timelines with each other's recent posts and refresh cached fan-out state"""
+    rows = []
+    for reader, author in ((user_a, user_b), (user_b, user_a)):
+        if is_large_account(author):
+            continue
+        recent = db.session.scalars(
+            select(Post.id).where(Post.user_id == author).order_by(Post.id.desc()).limit(ACCEPT_BACKFILL)
+        )
+        rows.extend({'user_id': reader, 'post_id': post_id} for post_id in recent)
+    insert_ignore(TimelineEntry, rows)
+    forget_large_connections(user_a)
+    forget_large_connections(user_b)
+
+def on_connection_removed(user_a, user_b):
+    """Take each user's posts back out of the other's timeline"""
+    for reader, author in ((user_a, user_b), (user_b, user_a)):
+        TimelineEntry.query.filter(
+            TimelineEntry.user_id == reader,
+            TimelineEntry.post_id.in_(select(Post.id).where(Post.user_id == author))
+        ).delete(synchronize_session=False)
+    forget_large_connections(user_a)
+    forget_large_connections(user_b)
+
+def large_connections(user_id):
+    """Connections of a user whose posts are merged in at read time"""
+    now = time.monotonic()
+    with _large_connections_lock:
+        entry = _large_connections.get(user_id)
+        if entry is not None and entry[0] > now:
+            _large_connections.move_to_end(user_id)
+            return entry[1]
+
+    connected = connected_user_ids(user_id)
+    large = frozenset(db.session.scalars(
+        select(User.id).where(User.id.in_(connected),
+                              User.connection_count > current_app.config['TIMELINE_FANOUT_LIMIT'])
+    )) if connected else frozenset()
+    with _large_connections_lock:
+        _large_connections[user_id] = (now + LARGE_CONNECTIONS_TTL, large)
+        _large_connections.move_to_end(user_id)
+        while len(_large_connections) > LARGE_CONNECTIONS_MAX_USERS:
+            _large_connections.popitem(last=False)
+    return large
+
+def forget_large_connections(user_id):
+    with _large_connections_lock:
+        _large_connections.pop(user_id, None)
+
+def read_timeline(user_id, limit=20, before=None):
+    """Newest post IDs in a user's feed, optionally older than post ID `before`"""
+    query = db.session.query(TimelineEntry.post_id).filter(TimelineEntry.user_id == user_id)
+    if before:
+        query = query.filter(TimelineEntry.post_id < before)
+    post_ids = [post_id for (post_id,) in query.order_by(TimelineEntry.post_id.desc()).limit(limit)]
+
+    large = large_connections(user_id)
+    if large:
+        query = db.session.query(Post.id).filter(Post.user_id.in_(large))
+        if before:
+            query = query.filter(Post.id < before)
+        post_ids.extend(post_id for (post_id,) in query.order_by(Post.id.desc()).limit(limit))
+        post_ids = sorted(set(post_ids), reverse=True)[:limit]
+    return post_ids
+
+def rebuild(length=None):
+    """Recount connections and rebuild every timeline from existing posts. Returns the number of entries."""
+    length = length or current_app.config['TIMELINE_LENGTH']
+
+    accepted = db.session.query(Connection.user_id, Connection.connected_user_id)\
+        .filter(Connection.status == 'accepted').all()
+    counts = {}
+    for a, b in accepted:
+        counts[a] = counts.get(a, 0) + 1
+        counts[b] = counts.get(b, 0) + 1
+    User.query.update({User.connection_count: 0}, synchronize_session=False)
+    db.session.bulk_update_mappings(User, [{'id': user_id, 'connection_count': count}
+                                           for user_id, count in counts.items()])
+
+    TimelineEntry.query.delete(synchronize_session=False)
+    limit = current_app.config['TIMELINE_FANOUT_LIMIT']
+    # (reader, author) pairs: yourself plus every connection that isn't a large account
+    selects = [select(User.id.label('reader'), User.id.label('author'))]
+    for reader, author in ((Connection.user_id, Connection.connected_user_id),
+                           (Connection.connected_user_id, Connection.user_id)):
+        selects.append(
+            select(reader, author)
+            .join(User, User.id == author)
+            .where(Connection.status == 'accepted', User.connection_count <= limit)
+        )
+    pairs = union_all(*selects).subquery()
+    insert_ignore_from(TimelineEntry, ['user_id', 'post_id'],
+                       select(pairs.c.reader, Post.id).join(pairs, Post.user_id == pairs.c.author))
+    trim([user_id for (user_id,) in db.session.query(TimelineEntry.user_id).distinct()], length)
+    db.session.commit()
+    return TimelineEntry.query.count()
@@ -0,0 +1,282 @@
+"""
+Trending Skills Module
+Streams skill mentions from new jobs, profile skills, endorsements and posts
+into a time-decayed count-min sketch, keeping the heaviest skills in a small
+candidate table. Each event costs a fixed number of counter updates and
+memory doesn't grow with the number of distinct skills.
+
+Every process keeps its own tracker, fed by following the committed rows of
+the source tables by ID, so all processes see the same events.
+
+Decay uses forward decay: an event at time t is added with weight
+2 ** ((t - landmark) / half_life), so older counts fade relative to new ones
+without touching every counter. Weights are rescaled when they grow large.
+"""
+from flask import current_app
+from sqlalchemy import func
+from datetime import datetime, timedelta
+import json
+import re
+import threading
+import time
+import zlib
+import numpy as np
+
+from extensions import db
+from models import Job, Skill, Endorsement, Post
+
+# Sketch shape: estimates overcount by at most ~e/WIDTH of the total weight
+# with probability 1 - e^-DEPTH
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+
+# Skills tracked as trending candidates
+HEAVY_HITTERS = 50
+
+# Distinct skill names recognised in post text
+VOCABULARY_MAX = 10000
+
+# Longest skill name, in words, looked for in post text
+MAX_SKILL_WORDS = 3
+
+# Seconds a computed top list is reused
+TOP_CACHE_SECONDS = 60
+
+# Weight of each signal
+WEIGHTS = {
+    'job': 3.0,
+    'post': 2.0,
+    'endorsement': 1.0,
+    'skill': 1.0
+}
+
+# Rescale once weights reach 2 ** RESCALE_EXPONENT
+RESCALE_EXPONENT = 32
+
+_TOKEN = re.compile(r'[a-z0-9][a-z0-9+#.\-]*')
+
+class TrendingSkills:
+    def __init__(self, half_life, now=None):
+        self.half_life = half_life
+        self.landmark = now if now is not None else time.time()
+        self.sketch = np.zeros((SKETCH_DEPTH, SKETCH_WIDTH), dtype=np.float64)
+        self.hitters = {}
+        self.names = {}
+        self.vocabulary = set()
+        self._lock = threading.Lock()
+
+    def _cells(self, key):
+        data = key.encode('utf-8')
+        return [zlib.crc32(data, row * 0x9E3779B1 & 0xFFFFFFFF) % SKETCH_WIDTH for row in range(SKETCH_DEPTH)]
+
+    def _rescale(self, now):
+        factor = 2.0 ** (-(now - self.landmark) / self.half_life)
+        self.sketch *= factor
+        for key in self.hitters:
+            self.hitters[key] *= factor
+        self.landmark = now
+
+    def add(self, name, weight=1.0, at=None):
+        """Count one mention of a skill, at `at` seconds since the epoch (default now)"""
+        display = (name or '').strip()
+        key = display.lower()
+        if not key or len(key) > 50:
+            return
+        at = at if at is not None else time.time()
+        with self._lock:
+            if (at - self.landmark) / self.half_life > RESCALE_EXPONENT:
+                self._rescale(at)
+            value = weight * 2.0 ** ((at - self.landmark) / self.half_life)
+
+            rows = range(SKETCH_DEPTH)
+            cells = self._cells(key)
+            self.sketch[rows, cells] += value
+            estimate = float(self.sketch[rows, cells].min())
+
+            if len(self.vocabulary) < VOCABULARY_MAX:
+                self.vocabulary.add(key)
+
+            if key in self.hitters or len(self.hitters) < HEAVY_HITTERS:
+                self.hitters[key] = estimate
+            else:
+                weakest = min(self.hitters, key=self.hitters.get)
+                if estimate <= self.hitters[weakest]:
+                    return
+                del self.hitters[weakest]
+                self.names.pop(weakest, None)
+                self.hitters[key] = estimate
+            # Prefer a capitalised spelling over an all lower-case one
+            if key not in self.names or (self.names[key] == key and display != key):
+                self.names[key] = display
+
+    def add_text(self, text, weight=1.0, at=None):
+        """Count known skill names mentioned in free text"""
+        words = [word.rstrip('.-') for word in _TOKEN.findall((text or '').lower())]
+        found = set()
+        for start in range(len(words)):
+            for end in range(start + 1, min(start + MAX_SKILL_WORDS, len(words)) + 1):
+                phrase = ' '.join(words[start:end])
+                if phrase in self.vocabulary:
+                    found.add(phrase)
+        for phrase in found:
+            self.add(phrase, weight, at)
+
+    def estimate(self, name, now=None):
+        """Decayed count of a skill as of `now`"""
+        key = name.strip().lower()
+        now = now if now is not None else time.time()
+        with self._lock:
+            value = float(self.sketch[range(SKETCH_DEPTH), self._cells(key)].min())
+            return value * 2.0 ** (-(now - self.landmark) / self.half_life)
+
+    def top(self, n, now=None):
+        """[(name, decayed count)] of the n heaviest skills as of `now`"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            rows = range(SKETCH_DEPTH)
+            scale = 2.0 ** (-(now - self.landmark) / self.half_life)
+            ranked = sorted(((float(self.sketch[rows, self._cells(key)].min()) * scale, key)
+                             for key in self.hitters), reverse=True)
+            return [(self.names.get(key, key), count) for count, key in ranked[:n]]
+
+_trending = None
+_warming = False
+_trending_lock = threading.Lock()
+_top_cache = (0.0, None, [])
+
+# Rows read per query while replaying or following the source tables
+POLL_BATCH = 1000
+
+def _timestamp(value):
+    return (value - datetime(1970, 1, 1)).total_seconds() if value else None
+
+def _job_skills(value):
+    try:
+        skills = json.loads(value) if value else []
+    except (TypeError, ValueError):
+        return []
+    return [skill for skill in skills if isinstance(skill, str)] if isinstance(skills, list) else []
+
+def _count_jobs(trending, rows):
+    for skills, created_at in rows:
+        for name in _job_skills(skills):
+            trending.add(name, WEIGHTS['job'], _timestamp(created_at))
+
+def _count_endorsements(trending, rows):
+    for name, created_at in rows:
+        trending.add(name, WEIGHTS['endorsement'], _timestamp(created_at))
+
+def _count_posts(trending, rows):
+    for content, created_at in rows:
+        trending.add_text(content, WEIGHTS['post'], _timestamp(created_at))
+
+def _count_skills(trending, rows):
+    # Profile skills have no timestamp; they count from when they're first seen
+    for (name,) in rows:
+        trending.add(name, WEIGHTS['skill'])
+
+# Each source: (id column, columns counted, join, counting function)
+SOURCES = {
+    'job': (Job.id, (Job.skills_required, Job.created_at), None, _count_jobs),
+    'endorsement': (Endorsement.id, (Skill.name, Endorsement.created_at),
+                    (Skill, Skill.id == Endorsement.skill_id), _count_endorsements),
+    'post': (Post.id, (Post.content, Post.created_at), None, _count_posts),
+    'skill': (Skill.id, (Skill.name,), None, _count_skills)
+}
+
+def _read(source, after, until=None, since=None):
+    """(last ID, rows) chunks of a source's rows with IDs in (after, until], oldest first"""
+    id_column, columns, join, _ = SOURCES[source]
+    while True:
+        query = db.session.query(id_column, *columns)
+        if join is not None:
+            query = query.join(*join)
+        query = query.filter(id_column > after)
+        if until is not None:
+            query = query.filter(id_column <= until)
+        if since is not None:
+            query = query.filter(columns[1] >= since)
+        rows = query.order_by(id_column).limit(POLL_BATCH).all()
+        if not rows:
+            return
+        after = rows[-1][0]
+        yield after, [row[1:] for row in rows]
+
+def warm_up(trending, until):
+    """Replay jobs, endorsements and posts from the last TRENDING_WARMUP_DAYS.
+    Returns the highest ID read from each source, where following starts."""
+    since = until - timedelta(days=current_app.config['TRENDING_WARMUP_DAYS'])
+    marks = {source: db.session.query(func.max(SOURCES[source][0])).scalar() or 0 for source in SOURCES}
+
+    # Existing profile skills only teach the vocabulary
+    for (name,) in db.session.query(Skill.name).distinct().limit(VOCABULARY_MAX):
+        trending.vocabulary.add(name.strip().lower())
+
+    for source in ('job', 'endorsement', 'post'):
+        for _, rows in _read(source, 0, until=marks[source], since=since):
+            SOURCES[source][3](trending, rows)
+    return marks
+
+def follow(trending, marks):
+    """Count rows committed since the last call, advancing `marks`"""
+    for source, (_, _, _, count) in SOURCES.items():
+        for last_id, rows in _read(source, marks[source]):
+            count(trending, rows)
+            marks[source] = last_id
+
+def _run(app):
+    global _trending, _warming
+    try:
+        with app.app_context():
+            try:
+                trending = TrendingSkills(app.config['TRENDING_HALF_LIFE_HOURS'] * 3600.0)
+                marks = warm_up(trending, datetime.utcnow())
+            finally:
+                db.session.remove()
+        _trending = trending
+    except Exception:
+        app.logger.exception("Failed to warm up trending skills")
+        with _trending_lock:
+            _warming = False
+        return
+
+    while True:
+        time.sleep(app.config['TRENDING_POLL_SECONDS'])
+        with app.app_context():
+            try:
+                follow(trending, marks)
+            except Exception:
+                app.logger.exception("Failed to update trending skills")
+            finally:
+                db.session.remove()
+
+def get_trending():
+    """The process-wide tracker, or None while it's being seeded from recent rows.
+
+    The first call starts a background thread that warms the tracker up and
+    then follows newly committed rows, so counts include other processes and
+    CLI imports within TRENDING_POLL_SECONDS and never rolled-back rows.
+    """
+    global _warming
+    if _trending is not None:
+        return _trending
+    with _trending_lock:
+        if _trending is None and not _warming:
+            _warming = True
+            threading.Thread(target=_run, args=(current_app._get_current_object(),),
+                             name='trending-skills', daemon=True).start()
+    return _trending
+
+def top_skills(n=6):
+    """Names of the n trending skills, recomputed at most every TOP_CACHE_SECONDS.
+    Empty until the warm-up has finished."""
+    global _top_cache
+    expires, size, names = _top_cache
+    if size == n and expires > time.monotonic():
+        return names
+    trending = get_trending()
+    if trending is None:
+        return []
+    names = [name for name, _ in trending.top(n)]
+    _top_cache = (time.monotonic() + TOP_CACHE_SECONDS, n, names)
+    return names
@@ -0,0 +1,142 @@
+# Schema helpers - bring an existing SQLite database up to date with models.py,
+# and write rows with whatever upsert the configured database supports
+from importlib import import_module
+from sqlalchemy import and_, func, insert, inspect, literal, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+
+def upgrade_schema():
+    """Create missing tables, columns and indexes.
+
+    db.create_all() only creates tables that don't exist yet, so columns and
+    indexes added to existing models are applied here with ALTER TABLE /
+    CREATE INDEX. New columns must be nullable or have a server default.
+    A new unique index fails with a RuntimeError naming the index's `dedupe`
+    command if the table already holds duplicates.
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    default = default.text if hasattr(default, 'text') else f"'{default}'"
+                    ddl += f' DEFAULT {default}'
+                conn.execute(text(ddl))
+
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.unique and index.name not in existing_indexes:
+                    check_duplicates(conn, index)
+                index.create(conn, checkfirst=True)
+
+def check_duplicates(conn, index):
+    """Raise if rows already break a unique index that's about to be created"""
+    columns = list(index.columns)
+    duplicates = conn.execute(
+        select(func.count()).select_from(
+            # NULLs never clash in a unique index
+            select(*columns).where(*(column.isnot(None) for column in columns))
+            .group_by(*columns).having(func.count() > 1).subquery()
+        )
+    ).scalar()
+    if duplicates:
+        names = ', '.join(column.name for column in columns)
+        raise RuntimeError(
+            f"Can't create unique index {index.name}: {duplicates} ({names}) values occur more than once "
+            f"in {index.table.name}. Remove the duplicates first with `{index.info.get('dedupe', 'a manual cleanup')}`."
+        )
+
+# Dialects whose insert() has on_conflict_do_update and on_conflict_do_nothing
+UPSERT_DIALECTS = ('sqlite', 'postgresql')
+
+def _upsert_insert(table, connection=None):
+    """The dialect's ON CONFLICT-capable insert() for table, or None where there isn't one"""
+    dialect = (connection.dialect if connection is not None else db.session.get_bind().dialect).name
+    if dialect not in UPSERT_DIALECTS:
+        return None
+    return import_module(f'sqlalchemy.dialects.{dialect}').insert(table)
+
+def increment(model, keys, counter, rows, connection=None):
+    """Add each row's `counter` value to the row with the same `keys`, inserting it if missing.
+    
+    Other columns in the rows are overwritten. Runs in the current transaction
+    of `connection`, or of the session by default, as one ON CONFLICT statement
+    where the database supports it and as an UPDATE, then INSERT per row elsewhere.
+    """
+    if not rows:
+        return
+    executor = connection or db.session
+    table = model.__table__
+    stmt = _upsert_insert(table, connection)
+    
+    if stmt is not None:
+        set_ = {name: stmt.excluded[name] for name in rows[0] if name not in keys}
+        set_[counter] = table.c[counter] + stmt.excluded[counter]
+        executor.execute(stmt.on_conflict_do_update(index_elements=keys, set_=set_), rows)
+        return
+    
+    for row in rows:
+        values = {name: value for name, value in row.items() if name not in keys}
+        values[counter] = table.c[counter] + row[counter]
+        add = update(table).where(and_(*(table.c[name] == row[name] for name in keys))).values(values)
+        if executor.execute(add).rowcount:
+            continue
+        try:
+            with executor.begin_nested():
+                executor.execute(insert(table).values(row))
+        except IntegrityError:
+            # Another transaction inserted the row first
+            executor.execute(add)
+
+def insert_ignore(model, rows, connection=None):
+    """Insert rows, skipping those that would break a unique index. Returns the number inserted.
+    
+    Runs in the current transaction as one ON CONFLICT DO NOTHING statement where
+    the database supports it, and as one INSERT per row in a savepoint elsewhere.
+    """
+    if not rows:
+        return 0
+    executor = connection or db.session
+    table = model.__table__
+    stmt = _upsert_insert(table, connection)
+    if stmt is not None:
+        return executor.execute(stmt.on_conflict_do_nothing(), rows).rowcount
+    
+    inserted = 0
+    for row in rows:
+        try:
+            with executor.begin_nested():
+                executor.execute(insert(table).values(row))
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
+
+def insert_ignore_from(model, columns, query, connection=None):
+    """INSERT INTO model (columns) SELECT query, skipping rows that would break a unique index.
+    
+    `columns` must include the columns of that index. Elsewhere than SQLite and
+    PostgreSQL the rows are filtered with NOT EXISTS instead of ON CONFLICT.
+    """
+    executor = connection or db.session
+    table = model.__table__
+    stmt = _upsert_insert(table, connection)
+    if stmt is not None:
+        return executor.execute(stmt.from_select(columns, query).on_conflict_do_nothing()).rowcount
+    
+    source = query.subquery()
+    values = list(source.c)
+    existing = select(literal(1)).select_from(table)\
+        .where(and_(*(table.c[name] == value for name, value in zip(columns, values))))
+    return executor.execute(
+        insert(table).from_select(columns, select(*values).where(~existing.exists()).distinct())
+    ).rowcount
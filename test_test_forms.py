@@ -0,0 +1,70 @@
+"""
+Post the rendered test forms back as a browser would, checking the field
+names the templates send are the ones the submit views grade.
+Uses a throwaway SQLite database: python -m pytest test_test_forms.py
+"""
+import itertools
+import os
+import re
+import tempfile
+
+work_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'forms.db')}"
+
+from app import app, db
+from models import User, PsychologicalTest, SkillTest, PsychologicalTestResult, SkillTestResult
+from seed_tests import seed_tests
+from werkzeug.security import generate_password_hash
+
+# Certificates for the submitted results are written here, not under static/
+app.config['UPLOAD_FOLDER'] = work_dir
+
+_RADIO = re.compile(r'<input[^>]*type="radio"[^>]*name="([^"]+)"[^>]*value="([^"]*)"', re.S)
+
+def _client():
+    seed_tests()
+    with app.app_context():
+        if not User.query.filter_by(email='forms@example.com').first():
+            db.session.add(User(email='forms@example.com', password_hash=generate_password_hash('password123'),
+                                name='Forms', role='seeker'))
+            db.session.commit()
+    client = app.test_client()
+    client.post('/login', json={'email': 'forms@example.com', 'password': 'password123'})
+    return client
+
+def _fields(html):
+    """{field name: [values]} of the radio buttons in a rendered form"""
+    fields = {}
+    for name, value in _RADIO.findall(html):
+        fields.setdefault(name, []).append(value)
+    return fields
+
+def test_every_psych_answer_combination_is_accepted():
+    client = _client()
+    with app.app_context():
+        test_id = PsychologicalTest.query.first().id
+    fields = _fields(client.get(f'/tests/psychological/{test_id}').data.decode())
+    assert len(fields) > 1
+
+    names = sorted(fields)
+    for values in itertools.product(*(fields[name] for name in names)):
+        response = client.post(f'/tests/psychological/{test_id}/submit', data=dict(zip(names, values)))
+        assert response.status_code == 302, dict(zip(names, values))
+
+    with app.app_context():
+        scores = {score for (score,) in db.session.query(PsychologicalTestResult.score).filter_by(test_id=test_id)}
+    assert max(scores) == sum(max(int(value) for value in fields[name]) for name in names)
+
+def test_skill_form_grades_each_question():
+    client = _client()
+    with app.app_context():
+        test = SkillTest.query.filter_by(skill_name='React.js').first()
+        test_id = test.id
+    fields = _fields(client.get(f'/tests/skill/{test_id}').data.decode())
+    assert sorted(fields) == ['q_0', 'q_1']
+
+    # The seeded React test's correct answers
+    client.post(f'/tests/skill/{test_id}/submit', data={'q_0': 'B', 'q_1': 'B'})
+    with app.app_context():
+        result = SkillTestResult.query.filter_by(test_id=test_id).order_by(SkillTestResult.id.desc()).first()
+    assert result.score == 100